@@ -0,0 +1,46 @@
+"""Bots, steered together from the server tick."""
+import random
+
+import angles
+from field import Player
+from constants import TICK_RATE, BOT_THINK_RATE
+
+
+SHOOT_CHANCE = 1 / 200  # per tick
+SWITCH_CHANCE = 1 / 500  # per tick
+LEAD_TICKS = 60  # bots aim where their target will be this many ticks later
+
+
+def think(player):
+    target = player.target
+    lead = target.acceleration * LEAD_TICKS
+    x = target.x + target.vx*LEAD_TICKS + target.dx*lead - player.x
+    y = target.y + target.vy*LEAD_TICKS + target.dy*lead - player.y
+    heading = angles.nearest(x, y, Player.TURN_ANGLE)
+    # turning anti clockwise takes the heading down
+    turn = -angles.difference(player.heading, heading, Player.HEADINGS)
+    turn = (turn > 0) - (turn < 0)
+    forward = 1 if x*x + y*y > 900 else 0
+    return turn, forward
+
+
+class Bots:
+    def __init__(self, indices, think_rate=BOT_THINK_RATE):
+        self.indices = list(indices)
+        # not the random of the field, recordings only keep what bots did
+        self.random = random.Random()
+        self.think_interval = max(TICK_RATE // think_rate, 1)
+        self.decisions = [(0, 0)] * len(self.indices)  # turn, forward
+
+    def step(self, field, tick):
+        # the chances are per tick so they do not depend on the think rate
+        shoot_chance = SHOOT_CHANCE * self.think_interval
+        switch_chance = SWITCH_CHANCE * self.think_interval
+        for n, index in enumerate(self.indices):
+            player = field.players[index]
+            shoot = switch = 0
+            if (tick + n) % self.think_interval == 0:
+                self.decisions[n] = think(player)
+                shoot = self.random.random() < shoot_chance
+                switch = self.random.random() < switch_chance
+            field.steer(index, *self.decisions[n], shoot, switch)
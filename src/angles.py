@@ -0,0 +1,26 @@
+"""
+Cosines and sines of whole degrees. Headings of players are whole turns of
+Player.TURN_ANGLE and the spread of weapons whole degrees, so they are
+looked up here instead of being worked out with a rotation matrix.
+"""
+import math
+
+
+COS = tuple(math.cos(math.radians(degrees)) for degrees in range(360))
+SIN = tuple(math.sin(math.radians(degrees)) for degrees in range(360))
+
+
+def rotate(x, y, degrees):
+    degrees %= 360
+    cos, sin = COS[degrees], SIN[degrees]
+    return cos * x - sin * y, sin * x + cos * y
+
+
+def nearest(x, y, step=1):
+    """The whole number of steps of step degrees closest to the angle of x, y."""
+    return round(math.degrees(math.atan2(y, x)) / step) % (360 // step)
+
+
+def difference(a, b, count):
+    """b - a the short way round, for angles that are whole steps of 360 / count degrees."""
+    return (b - a + count // 2) % count - count // 2
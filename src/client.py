@@ -1,4 +1,5 @@
 import time
+import select
 import socket
 from threading import Thread
 
@@ -8,13 +9,19 @@ from matrixx import Vector as V
 from field import *
 import draw_topdown, draw_raycast
 from draw_gui import draw_gui
-from constants import SCREEN_SIZE, HALF_SCREEN
+from constants import SCREEN_SIZE, HALF_SCREEN, TICK_RATE
 import action
+import codec
+from interpolation import Interpolator
+from prediction import Predictor
+from scheduler import Scheduler
+import protocol
+import snapshot
 
 
 serverAddressPort = ('85.229.18.138', 63834)
 serverAddressPort = ('localhost', 63834)
-bufferSize = 1024
+bufferSize = protocol.MAX_PACKET_SIZE
 
 UDPClientSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
 UDPClientSocket.settimeout(5)
@@ -31,14 +38,22 @@ DISPLAY = draw_raycast
 DISPLAY_ID = DISPLAY.DISPLAY_ID
 
 
-def game_thread(field):
+def receive_all():
+    # block for the first packet, then take whatever else is already waiting
+    packets = [UDPClientSocket.recvfrom(bufferSize)[0]]
+    while select.select([UDPClientSocket], [], [], 0)[0]:
+        packets.append(UDPClientSocket.recvfrom(bufferSize)[0])
+    return packets
+
+
+def game_thread(receiver, interpolator):
     global TIMEOUT, SELF_INDEX
     while 1:
         try:
-            received_byes = UDPClientSocket.recvfrom(bufferSize)[0]
-            SELF_INDEX = received_byes[-1]
-            received_byes = received_byes[:-1]
-            field.from_bytes(received_byes)
+            decoded = receiver.decode_newest(receive_all())
+            if decoded is not None:
+                SELF_INDEX = decoded[0]
+                interpolator.push(receiver.newest, receiver.input_ack, *decoded)
             if TIMEOUT:
                 print('\nRestored')
                 TIMEOUT = 0
@@ -46,32 +61,36 @@ def game_thread(field):
             if TIMEOUT == 0:
                 print('timeout', end='')
             else:
-                SELF_INDEX = server_connect(field)
+                interpolator.reset()
+                SELF_INDEX = server_connect(receiver, interpolator)
             SELF_INDEX = -1
             TIMEOUT += 1
 
 
-def server_connect(field):
-    self_index = -1
-    while self_index == -1:
+def server_connect(receiver, interpolator):
+    receiver.reset()
+    decoded = None
+    while decoded is None:
         try:
-            UDPClientSocket.sendto(b'0x00', serverAddressPort)
+            UDPClientSocket.sendto(protocol.encode_connect(codec.LATEST_VERSION), serverAddressPort)
             received_byes = UDPClientSocket.recvfrom(bufferSize)[0]
-            self_index = received_byes[-1]
-            received_byes = received_byes[:-1]
-            field.from_bytes(received_byes)
+            decoded = receiver.decode(received_byes)
         except socket.timeout:
             print('.', end='')
-    return self_index
+    interpolator.push(receiver.newest, receiver.input_ack, *decoded)
+    return decoded[0]
 
 
 if __name__ == '__main__':
     print('Create game')
     field = Field()
+    receiver = snapshot.Receiver()
+    interpolator = Interpolator()
+    predictor = Predictor()
     print('Logging into server', end='')
-    SELF_INDEX = server_connect(field)
+    SELF_INDEX = server_connect(receiver, interpolator)
     print('\nFetching game from server')
-    thread = Thread(target=game_thread, args=(field, ))
+    thread = Thread(target=game_thread, args=(receiver, interpolator, ))
     thread.start()
 
     pygame.init()
@@ -80,7 +99,7 @@ if __name__ == '__main__':
     sound3 = pygame.mixer.Sound('res/sound3.ogg')
     sound4 = pygame.mixer.Sound('res/sound4.ogg')
     sound5 = pygame.mixer.Sound('res/sound5.ogg')
-    clock = pygame.time.Clock()
+    scheduler = Scheduler(TICK_RATE)
 
     cur_actions = action.ActionStatus()
 
@@ -94,18 +113,31 @@ if __name__ == '__main__':
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-        clock.tick(128)
-        tick += 1
+        ticks = scheduler.due()
+        if not ticks:
+            time.sleep(scheduler.timeout())
+            continue
+
+        sample = interpolator.sample()
+        if sample is not None:
+            SELF_INDEX, player_count, input_ack, state = sample
+            field.from_values(*state, player_count, keep=SELF_INDEX)
+            if SELF_INDEX in state[0]:
+                predictor.reconcile(field.players[SELF_INDEX], input_ack)
 
-        # get steering data and send to server
+        # one input per tick like the server, applied right away and sent
         cur_actions.update_from_pygame(pygame.key.get_pressed())
-        field.steer(SELF_INDEX, *cur_actions.as_tuple)
-        UDPClientSocket.sendto(
-            cur_actions.as_byte,
-            serverAddressPort,
-        )
+        status = []
+        for _ in range(ticks):
+            field.steer(SELF_INDEX, *cur_actions.as_tuple)
+            input_seq = predictor.record(cur_actions.cur.value)
+            UDPClientSocket.sendto(
+                protocol.encode_input(predictor.unacked(), receiver.ack, input_seq),
+                serverAddressPort,
+            )
+            status += field.step(SELF_INDEX)
 
-        status = field.tick(SELF_INDEX)
+        tick += 1
         if tick % 3 == 0:
             continue
 
@@ -0,0 +1,173 @@
+"""
+Wire formats of the entities. The client asks for a version when connecting
+and the server answers with the newest version both of them know.
+
+Version 1 sends the values from to_values as they are, except for the
+heading which it sends as a direction. Version 2 quantizes them: positions
+are 16 bit fixed point, headings are 16 bit angles and velocities are small
+ints. Version 3 is version 2 with the heading in one byte as it is.
+"""
+import angles
+import protocol
+import weapons
+from field import Player
+from records import Records
+from constants import FIELD_SIZE
+
+
+POSITION_SCALE = 0xffff / FIELD_SIZE  # players never leave the field
+PROJECTILE_POSITION_SCALE = 0x7fff / (2 * FIELD_SIZE)  # projectiles do
+ANGLE_SCALE = 0x10000 / Player.HEADINGS
+VELOCITY_SCALE = 8
+
+
+def clamp(n, low, high):
+    return max(min(high, n), low)
+
+
+def to_angle(heading):
+    return round(heading * ANGLE_SCALE) & 0xffff
+
+
+def from_angle(angle):
+    return round(angle / ANGLE_SCALE) % Player.HEADINGS
+
+
+class CodecV1:
+    VERSION = 1
+    MSG_SNAPSHOT = protocol.MSG_SNAPSHOT
+    # pos x y, dir x y, vel x y, damage, points, cool down, target, weapon
+    PLAYERS = Records('B', 'ffffffHHHBB')
+    PROJECTILES = weapons.Weapon.RECORDS
+
+    @staticmethod
+    def encode_player(values):
+        pos_x, pos_y, heading, *rest = values
+        degrees = heading * Player.TURN_ANGLE
+        return pos_x, pos_y, angles.COS[degrees], angles.SIN[degrees], *rest
+
+    @staticmethod
+    def decode_player(values):
+        pos_x, pos_y, dir_x, dir_y, *rest = values
+        return pos_x, pos_y, angles.nearest(dir_x, dir_y, Player.TURN_ANGLE), *rest
+
+    @staticmethod
+    def encode_projectile(values):
+        return values
+
+    @staticmethod
+    def decode_projectile(values):
+        return values
+
+    @classmethod
+    def encode_state(cls, state):
+        players, projectiles = state
+        return (
+            {i: cls.encode_player(values) for i, values in players.items()},
+            {i: cls.encode_projectile(values) for i, values in projectiles.items()},
+        )
+
+    @classmethod
+    def decode_state(cls, state):
+        players, projectiles = state
+        return (
+            {i: cls.decode_player(values) for i, values in players.items()},
+            {i: cls.decode_projectile(values) for i, values in projectiles.items()},
+        )
+
+
+class CodecV2(CodecV1):
+    VERSION = 2
+    MSG_SNAPSHOT = protocol.MSG_SNAPSHOT_V2
+    # pos x y, angle, vel x y, damage, points, cool down, target, weapon
+    PLAYERS = Records('B', 'HHHbbHHHBB')
+    # parent, weapon id, pos x y, vel x y, colour, time to live, size
+    PROJECTILES = Records('H', 'BBhhbbIHB')
+
+    @staticmethod
+    def encode_player(values):
+        pos_x, pos_y, heading, vel_x, vel_y, *rest = values
+        return (
+            clamp(round(pos_x * POSITION_SCALE), 0, 0xffff),
+            clamp(round(pos_y * POSITION_SCALE), 0, 0xffff),
+            to_angle(heading),
+            clamp(round(vel_x * VELOCITY_SCALE), -0x80, 0x7f),
+            clamp(round(vel_y * VELOCITY_SCALE), -0x80, 0x7f),
+            *rest,
+        )
+
+    @staticmethod
+    def decode_player(values):
+        pos_x, pos_y, angle, vel_x, vel_y, *rest = values
+        return (
+            pos_x / POSITION_SCALE,
+            pos_y / POSITION_SCALE,
+            from_angle(angle),
+            vel_x / VELOCITY_SCALE,
+            vel_y / VELOCITY_SCALE,
+            *rest,
+        )
+
+    @staticmethod
+    def encode_projectile(values):
+        parent, weapon_id, pos_x, pos_y, vel_x, vel_y, *rest = values
+        return (
+            parent, weapon_id,
+            clamp(round(pos_x * PROJECTILE_POSITION_SCALE), -0x8000, 0x7fff),
+            clamp(round(pos_y * PROJECTILE_POSITION_SCALE), -0x8000, 0x7fff),
+            clamp(round(vel_x * VELOCITY_SCALE), -0x80, 0x7f),
+            clamp(round(vel_y * VELOCITY_SCALE), -0x80, 0x7f),
+            *rest,
+        )
+
+    @staticmethod
+    def decode_projectile(values):
+        parent, weapon_id, pos_x, pos_y, vel_x, vel_y, *rest = values
+        return (
+            parent, weapon_id,
+            pos_x / PROJECTILE_POSITION_SCALE,
+            pos_y / PROJECTILE_POSITION_SCALE,
+            vel_x / VELOCITY_SCALE,
+            vel_y / VELOCITY_SCALE,
+            *rest,
+        )
+
+
+class CodecV3(CodecV2):
+    VERSION = 3
+    MSG_SNAPSHOT = protocol.MSG_SNAPSHOT_V3
+    # pos x y, heading, vel x y, damage, points, cool down, target, weapon
+    PLAYERS = Records('B', 'HHBbbHHHBB')
+
+    @staticmethod
+    def encode_player(values):
+        pos_x, pos_y, heading, vel_x, vel_y, *rest = values
+        return (
+            clamp(round(pos_x * POSITION_SCALE), 0, 0xffff),
+            clamp(round(pos_y * POSITION_SCALE), 0, 0xffff),
+            heading,
+            clamp(round(vel_x * VELOCITY_SCALE), -0x80, 0x7f),
+            clamp(round(vel_y * VELOCITY_SCALE), -0x80, 0x7f),
+            *rest,
+        )
+
+    @staticmethod
+    def decode_player(values):
+        pos_x, pos_y, heading, vel_x, vel_y, *rest = values
+        return (
+            pos_x / POSITION_SCALE,
+            pos_y / POSITION_SCALE,
+            heading,
+            vel_x / VELOCITY_SCALE,
+            vel_y / VELOCITY_SCALE,
+            *rest,
+        )
+
+
+CODECS = {codec.VERSION: codec for codec in (CodecV1, CodecV2, CodecV3)}
+BY_MESSAGE = {codec.MSG_SNAPSHOT: codec for codec in CODECS.values()}
+LATEST_VERSION = max(CODECS)
+
+
+def negotiate(version):
+    return CODECS[clamp(version, 1, LATEST_VERSION)]
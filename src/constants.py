@@ -1,5 +1,6 @@
 # GAME
 FIELD_SIZE = 2000
+TICK_RATE = 120
 
 
 # DISPLAY
@@ -9,9 +10,14 @@ SCREEN_SIZE_SQ = SCREEN_SIZE ** 2
 
 
 # SERVER
+INTEREST_RADIUS = 1000  # clients are only sent what is this close to them
+SNAPSHOT_RATE = 60  # snapshots per second, the simulation runs at TICK_RATE
+VECTORIZED_PHYSICS = False  # move players and projectiles with numpy, see physics
+BOT_THINK_RATE = 30  # times per second every bot decides where to go
 
 
 # CLIENT
+INTERPOLATION_DELAY = 0.1  # seconds other players are shown in the past
 
 
 # COLOURS
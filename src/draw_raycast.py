@@ -257,7 +257,7 @@ def calc_player(player, colour, me):
 
 
 def calc_players(field, me):
-    for player in field.players:
+    for player in field.visible_players:
         if player is me: continue  # don't draw self
         colour = OTHER_COLOUR
         if player.cool_down:
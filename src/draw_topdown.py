@@ -124,7 +124,7 @@ def draw_frame(screen, field, player):
     for p in field.projectiles:
         draw_projectile(screen, p, offset=player.position)
 
-    for p in field.players:
+    for p in field.visible_players:
         colour = OTHER_COLOUR
         if p.cool_down:
             colour = COOL_DOWN_COLOUR
@@ -1,10 +1,10 @@
 import math
 import random
-from struct import pack, unpack
 
-from matrixx import Vector, Matrix
+from matrixx import Vector
 
 import field
+import angles
 import weapons
 from constants import FIELD_SIZE
 
@@ -25,47 +25,87 @@ def limit_zero(n, lim):
 
 
 class Entity:
-    byte_len = 4 * 4 + 1 * 4
+    """
+    Positions and velocities are kept as plain floats so the simulation can
+    update them in place, position and the like give them as Vectors.
+    """
+    __slots__ = ('x', 'y')
 
     def __init__(self, x, y):
-        self.position = Vector((x, y))
+        self.x = float(x)
+        self.y = float(y)
+
+    @property
+    def position(self):
+        return Vector((self.x, self.y))
+
+    @position.setter
+    def position(self, vector):
+        self.x, self.y = vector[0], vector[1]
 
     def get_dist_squared(self, pos):
-        return (self.position - pos).length_squared
+        dx = self.x - pos[0]
+        dy = self.y - pos[1]
+        return dx * dx + dy * dy
 
 
 class Player(Entity):
+    __slots__ = (
+        'field', 'name', 'vx', 'vy', 'heading', 'dx', 'dy', 'acceleration', 'target',
+        'visible', 'damage', 'points', 'cool_down', 'weapon_index',
+    )
     TURN_ANGLE = 3  # 120 * this many degrees per second
-    sin = math.sin(math.radians(TURN_ANGLE))
-    cos = math.cos(math.radians(TURN_ANGLE))
-    byte_len = 4*6 + 2*3 + 1*2
+    HEADINGS = 360 // TURN_ANGLE  # a heading is this many turns from the x axis
     MAX_ACCELERATION = 1
     ACCELERATION_FACTOR = 30
     FRICTION = 0.99  # set this to 0.99
     MAX_VELOCITY = 4  # set this to 4
     INIT_SIZE = 30
     SWITCH_COOL_DOWN = 60
+    WEAPONS = (
+        weapons.Bullet, weapons.Laser, weapons.Flame,
+        weapons.Mine, weapons.Minigun, weapons.Freeze,
+        weapons.Meltdown
+    )
 
     def __init__(self, field, name, x=FIELD_SIZE // 2, y=FIELD_SIZE // 2):
         super().__init__(x, y)
         self.field = field
         self.name = name
-        self.velocity = Vector((1, 0))
-        self.direction = Vector((1.0, 0.0))
+        self.vx, self.vy = 1.0, 0.0
+        self.set_heading(0)
         self.acceleration = 0
 
         self.target = self
+        self.visible = True
         self.damage = 0
         self.points = 0
         self.cool_down = 0
-
-        self.weapons = (
-            weapons.Bullet, weapons.Laser, weapons.Flame,
-            weapons.Mine, weapons.Minigun, weapons.Freeze,
-            weapons.Meltdown
-        )
         self.weapon_index = 0
 
+    @property
+    def velocity(self):
+        return Vector((self.vx, self.vy))
+
+    @velocity.setter
+    def velocity(self, vector):
+        self.vx, self.vy = vector[0], vector[1]
+
+    @property
+    def direction(self):
+        return Vector((self.dx, self.dy))
+
+    @direction.setter
+    def direction(self, vector):
+        self.set_heading(angles.nearest(vector[0], vector[1], self.TURN_ANGLE))
+
+    def set_heading(self, heading):
+        # dx, dy always come from the table, turning does not add up errors
+        self.heading = heading % self.HEADINGS
+        degrees = self.heading * self.TURN_ANGLE
+        self.dx = angles.COS[degrees]
+        self.dy = angles.SIN[degrees]
+
     @property
     def score(self):
         return self.points - self.damage
@@ -80,14 +120,14 @@ class Player(Entity):
 
     @property
     def weapon(self):
-        return self.weapons[self.weapon_index]
+        return self.WEAPONS[self.weapon_index]
 
     def set_position(self, x=-1, y=-1):
         if x == -1 and y == -1:
             x = random.randint(self.size, FIELD_SIZE - self.size)
             y = random.randint(self.size, FIELD_SIZE - self.size)
-        vector = Vector((limit_zero(x, FIELD_SIZE), limit_zero(y, FIELD_SIZE)))
-        self.position = vector
+        self.x = float(limit_zero(x, FIELD_SIZE))
+        self.y = float(limit_zero(y, FIELD_SIZE))
 
     def set_velocity(self, x=-1, y=-1):
         if x == -1 and y == -1:
@@ -97,24 +137,20 @@ class Player(Entity):
         self.velocity = vector.limit(self.MAX_VELOCITY)
 
     def move(self):
-        self.position += self.velocity
-        self.position.limit_zero(FIELD_SIZE)
-        self.velocity *= self.FRICTION
+        self.x = limit_zero(self.x + self.vx, FIELD_SIZE)
+        self.y = limit_zero(self.y + self.vy, FIELD_SIZE)
+        self.vx *= self.FRICTION
+        self.vy *= self.FRICTION
 
     def steer(self, turn, forward, shoot=0, weapon_switch=0):
         if turn > 0:  # anti clockwise
-            rotation_matrix = Matrix(((Player.cos, Player.sin), (-Player.sin, Player.cos)))
+            self.set_heading(self.heading - 1)
         elif turn < 0:  # clockwise
-            rotation_matrix = Matrix(((Player.cos, -Player.sin), (Player.sin, Player.cos)))
-        else:
-            rotation_matrix = None
-
-        if rotation_matrix is not None:
-            self.direction = rotation_matrix @ self.direction
-            self.direction = self.direction.unit
+            self.set_heading(self.heading + 1)
 
         if forward < 0:
-            self.velocity *= 0.9
+            self.vx *= 0.9
+            self.vy *= 0.9
         elif forward > 0:
             self.acceleration = 1
         else:
@@ -126,28 +162,41 @@ class Player(Entity):
         if weapon_switch and not self.cool_down:
             self.cool_down = self.SWITCH_COOL_DOWN
             self.weapon_index += weapon_switch
-            self.weapon_index = self.weapon_index % len(self.weapons)
+            self.weapon_index = self.weapon_index % len(self.WEAPONS)
 
     def accelerate(self):
         if self.acceleration == 0:
             return
-        accel = self.direction*(self.acceleration/self.ACCELERATION_FACTOR)
-        self.velocity += accel
-        self.velocity.limit(self.MAX_VELOCITY)
+        factor = self.acceleration / self.ACCELERATION_FACTOR
+        self.vx += self.dx * factor
+        self.vy += self.dy * factor
+        speed = math.sqrt(self.vx * self.vx + self.vy * self.vy)
+        if speed > self.MAX_VELOCITY:
+            self.vx *= self.MAX_VELOCITY / speed
+            self.vy *= self.MAX_VELOCITY / speed
         self.acceleration *= self.FRICTION
 
     def is_colliding(self, other):
         if other is self:
             return False
-        dist_squared = (self.position - other.position).length_squared
-        if dist_squared < (self.size + other.size) ** 2:
+        dx = self.x - other.x
+        dy = self.y - other.y
+        dist_squared = dx * dx + dy * dy
+        size = self.size
+        other_size = other.size
+        if dist_squared < (size + other_size) ** 2:
             try:
-                direction = (self.position - other.position).unit
-                momentum = (other.velocity.length * other.size + self.velocity.length * self.size) / 2
-                own_length = momentum/self.size
-                other_length = momentum/other.size
-                self.velocity = direction * own_length
-                other.velocity = direction * -other_length
+                distance = math.sqrt(dist_squared)
+                dx /= distance
+                dy /= distance
+                momentum = (
+                    math.sqrt(other.vx * other.vx + other.vy * other.vy) * other_size
+                    + math.sqrt(self.vx * self.vx + self.vy * self.vy) * size
+                ) / 2
+                own_length = momentum/size
+                other_length = momentum/other_size
+                self.vx, self.vy = dx * own_length, dy * own_length
+                other.vx, other.vy = dx * -other_length, dy * -other_length
 
                 '''
                 # from here: wikipedia.org/wiki/Elastic_collision#Two-dimensional_collision_with_two_moving_objects
@@ -192,25 +241,25 @@ class Player(Entity):
 
     def wall_bounce(self):
         bounce = False
-        x_pos = self.position[0]
-        y_pos = self.position[1]
+        x_pos = self.x
+        y_pos = self.y
         size = self.size
         spring_factor = 1
         if x_pos + size > FIELD_SIZE:
-            self.velocity += Vector((FIELD_SIZE - (x_pos + size), 0)) * spring_factor
+            self.vx += (FIELD_SIZE - (x_pos + size)) * spring_factor
             # self.direction *= Vector((-1, 1))
             bounce = True
         elif x_pos - size < 0:
-            self.velocity += Vector((-x_pos + size, 0)) * spring_factor
+            self.vx += (-x_pos + size) * spring_factor
             # self.direction *= Vector((-1, 1))
             bounce = True
 
         if y_pos + size > FIELD_SIZE:
-            self.velocity += Vector((0, FIELD_SIZE - (y_pos + size))) * spring_factor
+            self.vy += (FIELD_SIZE - (y_pos + size)) * spring_factor
             # self.direction *= Vector((1, -1))
             bounce = True
         elif y_pos - size < 0:
-            self.velocity += Vector((0, -y_pos + size)) * spring_factor
+            self.vy += (-y_pos + size) * spring_factor
             # self.direction *= Vector((1, -1))
             bounce = True
         #if bounce:
@@ -221,8 +270,10 @@ class Player(Entity):
         if self.cool_down:
             return
         self.cool_down = self.weapon.cool_down
-        self.velocity += self.direction * -self.weapon.recoil*0.1
-        self.field.new_projectile(self.weapon(self))
+        recoil = self.weapon.recoil * 0.1
+        self.vx -= self.dx * recoil
+        self.vy -= self.dy * recoil
+        self.field.new_projectile(self.field.pool.fire(self.weapon, self))
 
     def is_hit(self, projectile):
         dmg = projectile.hit(self)
@@ -237,44 +288,19 @@ class Player(Entity):
             return True
         return False
 
-    def from_bytes(self, bytes, field):
-        # current length  7*4 + 1*4 = 32 source_bytes
-        float_offsets = (0, 4, 8, 12, 16, 20, 24)
-        pos_x, pos_y, dir_x, dir_y, vel_x, vel_y = (
-            unpack('f', bytes[start:end])[0]
-            for start, end in zip(float_offsets, float_offsets[1:])
-        )
-        self.position = Vector((pos_x, pos_y))
-        self.direction = Vector((dir_x, dir_y))
-        self.velocity = Vector((vel_x, vel_y))
-        #self.acceleration = acceleration
-
-        dmg1, dmg2 = (bytes[pos] for pos in (24, 25))
-        self.damage = (dmg1 << 8) + dmg2
-
-        points1, points2 = (bytes[pos] for pos in (26, 27))
-        self.points = (points1 << 8) + points2
-
-        cd1, cd2 = (bytes[pos] for pos in (28, 29))
-        self.cool_down = (cd1 << 8) + cd2
-
-        target_id, self.weapon_index = (
-            bytes[pos] for pos in (30, 31)
-        )
+    def from_values(self, values, field):
+        (
+            self.x, self.y, heading, self.vx, self.vy,
+            self.damage, self.points, self.cool_down, target_id, self.weapon_index,
+        ) = values
+        self.set_heading(heading)
         self.target = field.players[target_id]
 
-    def to_bytes(self):
-        # current length  7*4 + 2*2 + 1*2 = 34 source_bytes
-        res = bytearray()
-        res += pack('f', self.position[0])  # 4
-        res += pack('f', self.position[1])  # 4
-        res += pack('f', self.direction[0])  # 4
-        res += pack('f', self.direction[1])  # 4
-        res += pack('f', self.velocity[0])  # 4
-        res += pack('f', self.velocity[1])  # 4
-        res += self.damage.to_bytes(2, 'big')  # 2
-        res += self.points.to_bytes(2, 'big')  # 2
-        res += self.cool_down.to_bytes(2, 'big')  # 1
-        res += self.target.name.to_bytes(1, 'big')  # 1
-        res += self.weapon_index.to_bytes(1, 'big')  # 1
-        return res
+    def to_values(self):
+        return (
+            self.x, self.y,
+            self.heading,
+            self.vx, self.vy,
+            self.damage, self.points, self.cool_down,
+            self.target.name, self.weapon_index,
+        )
@@ -1,9 +1,11 @@
 import random
-import math
-import time
+from time import perf_counter
 
 from entity import *
+import physics
 import weapons
+from grid import Grid
+from metrics import NoMetrics
 
 from matrixx import Vector
 
@@ -16,7 +18,16 @@ JOIN = 1 << 4
 TODO = 123
 
 
+def by_name(player):
+    return player.name
+
+
 class Field:
+    """
+    Not thread safe, a field belongs to the thread that ticks it. Other
+    threads hand their data over to that thread instead of writing to it,
+    see interpolation.Interpolator on the client.
+    """
     walls = (
         (Vector((0, 0)), Vector((FIELD_SIZE, 0))),
         (Vector((0, 0)), Vector((0, FIELD_SIZE))),
@@ -24,15 +35,25 @@ class Field:
         (Vector((FIELD_SIZE, FIELD_SIZE)), Vector((0, FIELD_SIZE))),
     )
 
-    def __init__(self):
+    def __init__(self, vectorized=False):
+        """
+        vectorized moves the players and projectiles with numpy when it is
+        installed, projectiles is a physics.ProjectileSystem then.
+        """
+        self.physics = None
+        self.player_type = Player
         self.players = []
         self.projectiles = []
+        self.pool = weapons.Pool()
+        if vectorized and physics.AVAILABLE:
+            self.physics = physics.PlayerPhysics()
+            self.player_type = physics.ArrayPlayer
+            self.projectiles = physics.ProjectileSystem()
         self.status = []
 
-        self.mutex = 0
-
-        self.tick_count = 0
-        self.next_tick = time.time()
+        self.next_net_id = 0
+        self.metrics = NoMetrics()  # the server swaps in a real one
+        self.recorder = None  # see replay.Recorder
 
     @property
     def score(self):
@@ -46,42 +67,66 @@ class Field:
     def entities(self):
         return self.players
 
+    @property
+    def visible_players(self):
+        return [player for player in self.players if player.visible]
+
     def get_players_by_dist(self, pos):
         return self.players.sort(key=lambda x: x.get_dist_squared(pos), reverse=True)
 
-    def mutex_wait(self):
-        while self.mutex:
-            pass
-        self.mutex = 1
-
     def append(self, entity):
         self.players.append(entity)
 
     def new_player(self):
-        entity = Player(self, len(self.players))
+        entity = self.player_type(self, len(self.players))
         x = random.randint(entity.size, FIELD_SIZE - entity.size)
         y = random.randint(entity.size, FIELD_SIZE - entity.size)
         entity.set_position(x, y)
         self.players.append(entity)
         self.status.append(JOIN)
+        if self.recorder is not None:
+            self.recorder.event('join')
         if len(self.players) >= MIN_PLAYERS:
             self.new_targets()
         return entity
 
     def new_projectile(self, projectile):
+        projectile.net_id = self.next_net_id
+        self.next_net_id = (self.next_net_id + 1) & 0xffff
         self.projectiles.append(projectile)
+        if self.physics is not None:
+            # the projectile system copied it
+            self.pool.release(projectile)
+
+    def drop_projectile(self, i):
+        # the last one moves into the hole, the order does not matter
+        projectile = self.projectiles[i]
+        self.projectiles[i] = self.projectiles[-1]
+        self.projectiles.pop()
+        self.pool.release(projectile)
 
     def remove(self, index):
+        if self.recorder is not None:
+            self.recorder.event('leave', index)
         self.status.append(JOIN)
+        if self.physics is not None:
+            self.physics.remove(self.players[index])
         del self.players[index]
         for i in range(index, len(self.players)):
             self.players[i].name = i
 
-        for i in range(len(self.projectiles)):
-            if self.projectiles[i].parent_index > index:
-                self.projectiles[i].parent_index -= 1
-            elif self.projectiles[i].parent_index == index:
-                del self.projectiles[i]
+        if self.physics is not None:
+            self.projectiles.remove_parent(index)
+        else:
+            i = 0
+            while i < len(self.projectiles):
+                projectile = self.projectiles[i]
+                if projectile.parent_index == index:
+                    self.drop_projectile(i)
+                    continue
+                if projectile.parent_index > index:
+                    projectile.parent_index -= 1
+                i += 1
 
         self.new_targets()
 
@@ -91,9 +136,9 @@ class Field:
             entity.new_target(self.players)
 
     def steer(self, n, turn, forward=0, shoot=0, weapon_switch=0):
-        self.mutex_wait()
+        if self.recorder is not None:
+            self.recorder.event('steer', n, turn, forward, shoot, weapon_switch)
         self.players[n].steer(turn, forward, shoot, weapon_switch)
-        self.mutex = 0
 
     def cast_ray_at_wall(self, pos, step):
         """Distance to first wall from pos in direction step."""
@@ -122,85 +167,141 @@ class Field:
                 min_t = t
         return min_t
 
-    def tick(self, self_index=-1):
+    def step(self, self_index=-1):
+        """Advance the simulation by one tick, see scheduler for the pacing."""
         # WALL_COLLISION 0, OTHER_COLLISION 1, SELF_HIT 2, TARGET_HIT 3, JOIN 4
-        while self.mutex:
-            pass
-        t = time.time()
-        if t < self.next_tick:
-            time.sleep(self.next_tick - t)
-        self.next_tick = time.time() + 1 / 120
-
-        for player in self.players:
-            player.accelerate()
-            player.move()
-            if player.cool_down:
-                player.cool_down -= 1
-
-            if player.wall_bounce():
-                self.status.append(WALL_COLLISION)
-
-        for entity_a in self.players:
-            hit_players = []
-            for projectile in self.projectiles:
-                if entity_a.is_hit(projectile):
-                    if entity_a.is_dead():
-                        self.status.append(TODO)
-                    hit_players.append(entity_a)
-                    if self_index == entity_a.name:
-                        self.status.append(SELF_HIT)
-                    elif self_index == entity_a.name:
-                        self.status.append(TARGET_HIT)
-
-            for entity_b in self.players:
-                if entity_a is entity_b:
-                    continue
-                elif entity_b.target in hit_players:
+        if self.recorder is not None:
+            self.recorder.step(self)
+        start = perf_counter()
+        players = self.visible_players
+        if self.physics is not None:
+            # every player at once, there are no hidden ones on the server
+            self.status += [WALL_COLLISION] * self.physics.step()
+        else:
+            for player in players:
+                player.accelerate()
+                player.move()
+                if player.cool_down:
+                    player.cool_down -= 1
+
+                if player.wall_bounce():
+                    self.status.append(WALL_COLLISION)
+        start = self.metrics.phase('movement', start)
+
+        hit_names = set()
+        if self.physics is not None:
+            # all of them up front, a weapon at a time
+            hits = self.projectiles.hits(players, self.physics)
+        else:
+            hits = self.plain_hits(players)
+        for player, damage in hits:
+            player.damage += damage
+            if player.is_dead():
+                self.status.append(TODO)
+            hit_names.add(player.name)
+            if self_index == player.name:
+                self.status.append(SELF_HIT)
+        start = self.metrics.phase('projectile_hits', start)
+
+        # players only get bigger from here on, by a point for every hit
+        max_size = max((player.size for player in players), default=0) + len(hit_names)
+        grid = Grid(players)
+        for entity_a in players:
+            targeting = []
+            if entity_a.name in hit_names:
+                targeting = [
+                    entity_b for entity_b in players
+                    if entity_b.target is entity_a and entity_b is not entity_a
+                ]
+                for entity_b in targeting:
                     entity_b.new_target(self.players)
                     entity_b.points += 1
+
+            near = grid.near(entity_a.x, entity_a.y, entity_a.size + max_size)
+            for entity_b in sorted(near, key=by_name):
+                if entity_b is entity_a or entity_b in targeting:
+                    continue
                 elif entity_a.is_colliding(entity_b):
                     self.status.append(OTHER_COLLISION)
-
-        for projectile in self.projectiles:
-            if projectile.tick():
-                self.projectiles.remove(projectile)
+        start = self.metrics.phase('collisions', start)
+
+        if self.physics is not None:
+            self.projectiles.tick()
+        else:
+            i = 0
+            while i < len(self.projectiles):
+                if self.projectiles[i].tick():
+                    self.drop_projectile(i)
+                else:
+                    i += 1
+        self.metrics.phase('projectiles', start)
         status = self.status
         self.status = []
         return status
 
-    def from_bytes(self, received_bytes):
-        self.mutex_wait()
-        players = received_bytes[0]
-        while players < len(self.players):
+    def projectile_values(self):
+        """to_values of every projectile by net id."""
+        if self.physics is not None:
+            return dict(self.projectiles.items())
+        return {p.net_id: p.to_values() for p in self.projectiles}
+
+    def plain_hits(self, players):
+        """
+        Yields (player, damage) for every projectile that hit, player by
+        player. Only the projectiles that can reach a player are tested.
+        """
+        grid = Grid(players)
+        max_size = max((player.size for player in players), default=0)
+        reachable = {player.name: [] for player in players}
+        for projectile in self.projectiles:
+            near = set()
+            for x, y, radius in projectile.reach(self, max_size):
+                near.update(grid.near(x, y, radius))
+            for player in near:
+                reachable[player.name].append(projectile)
+
+        for player in players:
+            for projectile in reachable[player.name]:
+                damage = projectile.hit(player)
+                if damage:
+                    yield player, damage
+
+    def from_values(self, players, projectiles, player_count, keep=-1):
+        # players that are not in players are out of sight and kept hidden,
+        # except for keep which is left as it is
+        while player_count < len(self.players):
             self.remove(-1)
-        while players > len(self.players):
+        while player_count > len(self.players):
             self.new_player()
 
-        projectiles = received_bytes[1]
-        self.projectiles = []
-
-        received_bytes = received_bytes[2:]
         for i, player in enumerate(self.players):
-            player.from_bytes(
-                received_bytes[i * Player.byte_len: (i+1) * Player.byte_len],
-                self
-            )
-
-        received_bytes = received_bytes[players * Player.byte_len:]
-        byte_len = weapons.Weapon.byte_len
-        for i in range(projectiles):
-            relevant_bytes = received_bytes[i * byte_len: (i+1) * byte_len]
-            projectile = weapons.from_bytes(self.players, relevant_bytes)
+            if i == keep and i not in players:
+                continue
+            values = players.get(i)
+            player.visible = values is not None
+            if player.visible:
+                player.from_values(values, self)
+
+        if self.physics is not None:
+            self.projectiles.clear()
+            for net_id, values in projectiles.items():
+                projectile = weapons.from_values(net_id, values, self.pool)
+                self.projectiles.append(projectile)
+                self.pool.release(projectile)
+            return
+
+        # update the projectiles we already have instead of making new ones
+        current = {projectile.net_id: projectile for projectile in self.projectiles}
+        self.projectiles = []
+        for net_id, values in projectiles.items():
+            projectile = current.pop(net_id, None)
+            if projectile is None or projectile.WEAPON_ID != values[1]:
+                if projectile is not None:
+                    self.pool.release(projectile)
+                projectile = weapons.from_values(net_id, values, self.pool)
+            else:
+                projectile.from_values(values)
             self.projectiles.append(projectile)
+        for projectile in current.values():
+            self.pool.release(projectile)
 
-        self.mutex = 0
-
-    def to_bytes(self):
-        res = bytearray()
-        res += len(self.players).to_bytes(1, 'big')
-        res += len(self.projectiles).to_bytes(1, 'big')
-        for player in self.players:
-            res += player.to_bytes()
-        for projectile in self.projectiles:
-            res += projectile.to_bytes()
-        return res
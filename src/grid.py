@@ -0,0 +1,37 @@
+"""
+Uniform grid over the field, the broadphase of Field.step. Things go in the
+cell their position is in and near() gives everything in the cells a circle
+overlaps, which still has to be tested properly. Positions outside of the
+field count as on its edge, projectiles can fly out of it.
+"""
+from constants import FIELD_SIZE
+
+
+CELL_SIZE = 128  # about two players at their starting size
+
+
+class Grid:
+    def __init__(self, items=(), cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        for item in items:
+            self.insert(item, item.x, item.y)
+
+    def cell(self, value):
+        return int(min(max(value, 0), FIELD_SIZE) // self.cell_size)
+
+    def insert(self, item, x, y):
+        key = self.cell(x), self.cell(y)
+        if key in self.cells:
+            self.cells[key].append(item)
+        else:
+            self.cells[key] = [item]
+
+    def near(self, x, y, radius):
+        """Everything in the cells within radius of x, y, in no particular order."""
+        cells = self.cells
+        for cell_y in range(self.cell(y - radius), self.cell(y + radius) + 1):
+            for cell_x in range(self.cell(x - radius), self.cell(x + radius) + 1):
+                items = cells.get((cell_x, cell_y))
+                if items:
+                    yield from items
@@ -0,0 +1,105 @@
+"""
+Snapshot buffer of the client. Other players and projectiles are shown a
+little in the past, interpolated between the two snapshots around that
+time, so they move smoothly however often snapshots arrive. The own player
+is always taken from the newest snapshot.
+"""
+import time
+from collections import deque
+from threading import Lock
+
+import angles
+from field import Player
+from constants import INTERPOLATION_DELAY
+
+
+BUFFER_LENGTH = 32
+TELEPORT_DISTANCE = 200  # further than this in one snapshot is a respawn
+
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+
+def lerp_player(a, b, t):
+    a_x, a_y, a_heading, a_vel_x, a_vel_y, *_ = a
+    b_x, b_y, b_heading, b_vel_x, b_vel_y, *rest = b
+    if (b_x - a_x) ** 2 + (b_y - a_y) ** 2 > TELEPORT_DISTANCE ** 2:
+        return b
+    turn = angles.difference(a_heading, b_heading, Player.HEADINGS)
+    return (
+        lerp(a_x, b_x, t), lerp(a_y, b_y, t),
+        round(a_heading + turn * t) % Player.HEADINGS,
+        lerp(a_vel_x, b_vel_x, t), lerp(a_vel_y, b_vel_y, t),
+        *rest,
+    )
+
+
+def lerp_projectile(a, b, t):
+    parent, weapon_id, b_x, b_y, *rest = b
+    return (parent, weapon_id, lerp(a[2], b_x, t), lerp(a[3], b_y, t), *rest)
+
+
+def lerp_entities(a, b, t, function):
+    return {
+        key: function(a[key], values, t) if key in a else values
+        for key, values in b.items()
+    }
+
+
+class Interpolator:
+    """
+    Also how snapshots get from the receiving thread to the one that owns
+    the field, the lock is only held to add one or to copy the buffer.
+    """
+    def __init__(self, delay=INTERPOLATION_DELAY):
+        self.delay = delay
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # (arrival time, seq, input ack, self index, player count, state)
+            self.snapshots = deque(maxlen=BUFFER_LENGTH)
+            self.fresh = False
+
+    def push(self, seq, input_ack, self_index, player_count, state):
+        snapshot = (seq, input_ack, self_index, player_count, state)
+        with self.lock:
+            if self.snapshots and self.snapshots[-1][1] == seq:
+                # another fragment of the newest snapshot, keep when it arrived
+                self.snapshots[-1] = (self.snapshots[-1][0], *snapshot)
+            else:
+                self.snapshots.append((time.monotonic(), *snapshot))
+            self.fresh = True
+
+    def sample(self, now=None):
+        """
+        (self index, player count, input ack, state) to show at now. The own
+        player is only in the state if a snapshot arrived since the last
+        sample, input ack is the newest of our inputs that went into it.
+        """
+        with self.lock:
+            snapshots = tuple(self.snapshots)
+            fresh, self.fresh = self.fresh, False
+        if not snapshots:
+            return None
+        render_time = (time.monotonic() if now is None else now) - self.delay
+
+        _, _, input_ack, self_index, player_count, newest = snapshots[-1]
+        after = 0
+        while after < len(snapshots) - 1 and snapshots[after][0] < render_time:
+            after += 1
+        b_time, *_, (b_players, b_projectiles) = snapshots[after]
+        if after == 0 or b_time <= render_time:
+            players, projectiles = dict(b_players), b_projectiles
+        else:
+            a_time, *_, (a_players, a_projectiles) = snapshots[after - 1]
+            t = (render_time - a_time) / (b_time - a_time)
+            players = lerp_entities(a_players, b_players, t, lerp_player)
+            projectiles = lerp_entities(a_projectiles, b_projectiles, t, lerp_projectile)
+
+        players.pop(self_index, None)
+        if fresh and self_index in newest[0]:
+            players[self_index] = newest[0][self_index]
+        return self_index, player_count, input_ack, (players, projectiles)
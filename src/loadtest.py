@@ -0,0 +1,262 @@
+"""
+Headless load generator. Runs many clients in one process that connect,
+decode snapshots and send inputs just like client.py, without pygame.
+
+    python loadtest.py --clients 200 --rate 60 --duration 30
+
+Reports how fast the server ticks and sends snapshots, how many of them
+arrive, how big the packets are and how long it takes from sending an input
+until a snapshot says it has been applied. The tick rate comes from the
+stats socket of the server, which only answers on the same machine.
+Through lobby.py that is the stats socket of one of its arenas, which has
+to be given:
+
+    python loadtest.py --lobby --stats-port 64835
+"""
+import json
+import time
+import random
+import socket
+import argparse
+import selectors
+
+import codec
+import protocol
+import snapshot
+from action import Action
+from lobby import FIRST_ARENA_PORT
+from metrics import STATS_PORT_OFFSET
+from server import localPort
+
+
+REPORT_INTERVAL = 1  # seconds
+CHANGE_CHANCE = 0.05  # chance per input that a random client presses something else
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    return sorted(values)[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def parse_script(script):
+    # FWD+LEFT,FWD,SHOOT
+    return [
+        sum((Action[name].value for name in step.split('+') if name), 0)
+        for step in script.split(',')
+    ]
+
+
+class Bot:
+    def __init__(self, address, version, script=None):
+        self.address = address
+        self.version = version
+        self.script = script
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.receiver = snapshot.Receiver()
+
+        self.input_seq = 0
+        self.action_value = 0
+        self.inputs = []  # (seq, action value) the server has not applied
+        self.sent_at = {}  # input seq: time it was sent
+        self.connected = False
+
+    def connect(self):
+        self.socket.sendto(protocol.encode_connect(self.version), self.address)
+
+    def next_action(self):
+        if self.script:
+            return self.script[self.input_seq % len(self.script)]
+        if random.random() < CHANGE_CHANCE:
+            self.action_value = random.getrandbits(len(Action))
+        return self.action_value
+
+    def send_input(self, now):
+        self.input_seq += 1
+        self.inputs.append((self.input_seq, self.next_action()))
+        self.inputs = self.inputs[-protocol.INPUT_REDUNDANCY:]
+        self.sent_at[self.input_seq] = now
+        message = protocol.encode_input(
+            [action_value for _, action_value in self.inputs],
+            self.receiver.ack, self.input_seq,
+        )
+        self.socket.sendto(message, self.address)
+
+    def receive(self, stats, now):
+        while 1:
+            try:
+                message = self.socket.recv(protocol.MAX_PACKET_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionRefusedError:
+                stats.refused += 1
+                return
+            stats.packets += 1
+            stats.sizes.append(len(message))
+            self.connected = True
+
+            ack = self.receiver.ack
+            self.receiver.decode(message)
+            if self.receiver.ack != ack:
+                stats.snapshots += 1
+                stats.seen(self.receiver.ack)
+
+            input_ack = self.receiver.input_ack
+            for seq in [seq for seq in self.sent_at if seq <= input_ack]:
+                stats.latencies.append(now - self.sent_at.pop(seq))
+            self.inputs = [item for item in self.inputs if item[0] > input_ack]
+
+
+class ServerStats:
+    """Asks the stats socket of the server how fast it ticks."""
+    def __init__(self, address):
+        self.address = address
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.tick_rate = None  # until the server answers
+
+    def ask(self):
+        try:
+            self.socket.sendto(b'', self.address)
+        except OSError:
+            pass
+
+    def receive(self):
+        while 1:
+            try:
+                message = self.socket.recv(0xffff)
+            except (BlockingIOError, InterruptedError, ConnectionRefusedError):
+                return
+            self.tick_rate = json.loads(message)['per_second'].get('ticks')
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.packets = 0
+        self.snapshots = 0
+        self.refused = 0
+        self.sizes = []
+        self.latencies = []
+        self.first_seq = self.newest_seq = 0
+
+    def seen(self, seq):
+        # the server numbers its snapshots, that is how fast it sends them,
+        # it ticks faster than that
+        self.first_seq = min(self.first_seq or seq, seq)
+        self.newest_seq = max(self.newest_seq, seq)
+
+    def add(self, other):
+        self.packets += other.packets
+        self.snapshots += other.snapshots
+        self.refused += other.refused
+        self.sizes += other.sizes
+        self.latencies += other.latencies
+        if other.first_seq:
+            self.seen(other.first_seq)
+            self.seen(other.newest_seq)
+
+    def report(self, elapsed, bots, tick_rate=None):
+        connected = sum(bot.connected for bot in bots)
+        sizes = self.sizes or [0]
+        latencies = [latency * 1000 for latency in self.latencies]
+        ticks = '     ?' if tick_rate is None else f'{tick_rate:6.1f}'
+        print(
+            f'{connected}/{len(bots)} connected | '
+            f'server {ticks} ticks/s, sends {(self.newest_seq - self.first_seq) / elapsed:6.1f} snapshots/s | '
+            f'received {self.snapshots / elapsed / max(connected, 1):6.1f} snapshots/s per client, '
+            f'{self.packets / elapsed:7.0f} packets/s | '
+            f'size avg {sum(sizes) / len(sizes):5.0f} max {max(sizes):4} | '
+            f'latency ms p50 {percentile(latencies, 0.5):5.1f} '
+            f'p90 {percentile(latencies, 0.9):5.1f} '
+            f'p99 {percentile(latencies, 0.99):5.1f} '
+            f'max {max(latencies, default=0):5.1f}'
+            + (f' | {self.refused} refused' if self.refused else '')
+        )
+
+
+def run(address, clients, rate, duration, version, script=None, ramp=0.0, stats_port=None):
+    bots = [Bot(address, version, script) for _ in range(clients)]
+    selector = selectors.DefaultSelector()
+    for bot in bots:
+        selector.register(bot.socket, selectors.EVENT_READ, bot)
+    server_stats = ServerStats((address[0], stats_port or address[1] + STATS_PORT_OFFSET))
+    selector.register(server_stats.socket, selectors.EVENT_READ, server_stats)
+    server_stats.ask()
+
+    stats = Stats()
+    total = Stats()
+    start = last_report = time.monotonic()
+    input_interval = 1 / rate
+    next_input = start
+    started = 0
+    while time.monotonic() - start < duration:
+        now = time.monotonic()
+        # bring the clients in over ramp seconds instead of all at once
+        should_start = clients if ramp <= 0 else min(clients, int(clients * (now - start) / ramp) + 1)
+        while started < should_start:
+            bots[started].connect()
+            started += 1
+
+        if now >= next_input:
+            for bot in bots[:started]:
+                if bot.connected:
+                    bot.send_input(now)
+                elif random.random() < input_interval:
+                    bot.connect()  # about once a second until it gets an answer
+            next_input += input_interval
+            if next_input < now:
+                next_input = now + input_interval
+
+        for key, _ in selector.select(max(next_input - time.monotonic(), 0)):
+            if key.data is server_stats:
+                server_stats.receive()
+            else:
+                key.data.receive(stats, time.monotonic())
+
+        now = time.monotonic()
+        if now - last_report >= REPORT_INTERVAL:
+            stats.report(now - last_report, bots, server_stats.tick_rate)
+            server_stats.ask()
+            total.add(stats)
+            stats.reset()
+            last_report = now
+
+    total.add(stats)
+    print('total')
+    total.report(time.monotonic() - start, bots, server_stats.tick_rate)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=localPort)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=60, help='inputs per second per client')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--ramp', type=float, default=0, help='seconds to connect all clients over')
+    parser.add_argument('--version', type=int, default=codec.LATEST_VERSION, help='wire format')
+    parser.add_argument(
+        '--stats-port', type=int, help=f'stats socket of the server, default port + {STATS_PORT_OFFSET}'
+    )
+    parser.add_argument(
+        '--lobby', action='store_true',
+        help='connect through lobby.py, the tick rate is then read from --stats-port',
+    )
+    parser.add_argument(
+        '--script', help='actions to cycle through instead of random ones, e.g. FWD+LEFT,FWD,SHOOT'
+    )
+    args = parser.parse_args()
+    if args.lobby and args.stats_port is None:
+        # the lobby has no stats socket, its arenas have one each
+        parser.error(
+            '--lobby needs the --stats-port of an arena, the first one is on '
+            f'{FIRST_ARENA_PORT + STATS_PORT_OFFSET}'
+        )
+    run(
+        (args.host, args.port), args.clients, args.rate, args.duration, args.version,
+        parse_script(args.script) if args.script else None, args.ramp, args.stats_port,
+    )
@@ -0,0 +1,132 @@
+"""
+Lobby for running many arenas on one machine. Every arena is a normal
+Server with its own Field in its own process, listening on a local port.
+The lobby owns the public port, puts every new client in the first arena
+that has fewer than ARENA_SIZE clients, or in the one with the fewest once
+they all have that many, and relays the datagrams both ways.
+
+Every client gets its own local socket towards its arena, so the arena
+sees one address per client just like when it is on the public port
+itself.
+"""
+import os
+import time
+import socket
+import selectors
+from multiprocessing import Process
+
+from field import Field
+from server import Server, localIP, localPort, bufferSize, MAX_CONNECTIONS
+from constants import VECTORIZED_PHYSICS
+
+
+ARENA_HOST = '127.0.0.1'
+FIRST_ARENA_PORT = localPort + 1
+NUM_ARENAS = os.cpu_count() or 1
+ARENA_SIZE = 8  # clients per arena before the next one fills up
+CLIENT_TIMEOUT = 30  # seconds of silence before a client is forgotten
+
+
+def run_arena(port):
+    Server(Field(vectorized=VECTORIZED_PHYSICS), (ARENA_HOST, port)).run()
+
+
+class Route:
+    def __init__(self, client, arena):
+        self.client = client
+        self.arena = arena
+        self.last_seen = time.monotonic()
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind((ARENA_HOST, 0))
+        self.socket.connect((ARENA_HOST, FIRST_ARENA_PORT + arena))
+
+
+class Lobby:
+    def __init__(self, address=(localIP, localPort), num_arenas=NUM_ARENAS):
+        self.num_arenas = num_arenas
+        self.routes = {}  # client address: Route
+        self.arenas = [
+            Process(target=run_arena, args=(FIRST_ARENA_PORT + i, ), daemon=True)
+            for i in range(num_arenas)
+        ]
+
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(address)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ)
+
+    def load(self):
+        clients = [0] * self.num_arenas
+        for route in self.routes.values():
+            clients[route.arena] += 1
+        return clients
+
+    def pick_arena(self):
+        clients = self.load()
+        for arena, count in enumerate(clients):
+            if count < ARENA_SIZE:
+                return arena
+        arena = min(range(self.num_arenas), key=clients.__getitem__)
+        return arena if clients[arena] < MAX_CONNECTIONS else -1
+
+    def from_client(self):
+        while 1:
+            try:
+                message, address = self.socket.recvfrom(bufferSize)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                continue
+
+            route = self.routes.get(address)
+            if route is None:
+                arena = self.pick_arena()
+                if arena == -1:
+                    continue
+                route = self.routes[address] = Route(address, arena)
+                self.selector.register(route.socket, selectors.EVENT_READ, route)
+            route.last_seen = time.monotonic()
+            try:
+                route.socket.send(message)
+            except OSError as e:
+                print(f'Could not forward to arena {route.arena}: {e}')
+
+    def from_arena(self, route):
+        while 1:
+            try:
+                message = route.socket.recv(bufferSize)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionRefusedError:
+                # the arena is not up yet
+                return
+            try:
+                self.socket.sendto(message, route.client)
+            except OSError as e:
+                print(f'Could not send to {route.client}: {e}')
+
+    def drop_expired(self):
+        now = time.monotonic()
+        for address, route in list(self.routes.items()):
+            if now - route.last_seen > CLIENT_TIMEOUT:
+                self.selector.unregister(route.socket)
+                route.socket.close()
+                del self.routes[address]
+
+    def run(self):
+        for arena in self.arenas:
+            arena.start()
+        print(f'Lobby up and listening, {self.num_arenas} arenas')
+        while 1:
+            for key, _ in self.selector.select(1):
+                if key.data is None:
+                    self.from_client()
+                else:
+                    self.from_arena(key.data)
+            self.drop_expired()
+
+
+if __name__ == '__main__':
+    Lobby().run()
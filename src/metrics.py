@@ -0,0 +1,179 @@
+"""
+Server instrumentation. Phases of the tick are timed into histograms,
+traffic is counted per client and every INTERVAL the rates of the last
+interval are worked out. Server exposes report() on a local stats socket
+and can dump it to a file.
+
+    python metrics.py [port]  # prints the report of a running server
+"""
+import os
+import sys
+import json
+import time
+import socket
+from bisect import bisect_left
+from time import perf_counter
+
+from constants import TICK_RATE
+
+
+INTERVAL = 1  # seconds between working out rates
+BUDGET = 1 / TICK_RATE
+# upper bounds of the histogram buckets in milliseconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, BUDGET * 1000, 16, 33, 66, float('inf'))
+STATS_PORT_OFFSET = 1000  # the stats socket is on the game port plus this
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else 0,
+            'max_ms': self.max,
+            'buckets_ms': {
+                str(bound): count for bound, count in zip(BUCKETS, self.counts) if count
+            },
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.phases = {}
+        self.ticks = 0
+        self.overruns = 0
+        self.rejected_inputs = 0  # input packets that could not be decoded
+        self.rejected_from = None  # who sent the last one
+        self.counts = {}  # players, projectiles, connections
+        # address: [bytes sent, packets sent, bytes received, packets received]
+        self.traffic = {}
+        self.rates = {}
+        self.last_traffic = {}
+        self.last_ticks = self.last_overruns = self.last_rejected = 0
+        self.last_roll = time.monotonic()
+
+    def add(self, phase, seconds):
+        if phase not in self.phases:
+            self.phases[phase] = Histogram()
+        self.phases[phase].add(seconds)
+
+    def phase(self, phase, start):
+        """Adds the time since start to phase, returns now to start the next one."""
+        now = perf_counter()
+        self.add(phase, now - start)
+        return now
+
+    def tick(self, seconds, **counts):
+        self.add('tick', seconds)
+        self.ticks += 1
+        if seconds > BUDGET:
+            self.overruns += 1
+        self.counts.update(counts)
+
+    def traffic_of(self, address):
+        if address not in self.traffic:
+            self.traffic[address] = [0, 0, 0, 0]
+        return self.traffic[address]
+
+    def sent(self, address, size):
+        traffic = self.traffic_of(address)
+        traffic[0] += size
+        traffic[1] += 1
+
+    def received(self, address, size):
+        traffic = self.traffic_of(address)
+        traffic[2] += size
+        traffic[3] += 1
+
+    def rejected(self, address):
+        self.rejected_inputs += 1
+        self.rejected_from = address
+
+    def forget(self, address):
+        self.traffic.pop(address, None)
+        self.last_traffic.pop(address, None)
+
+    def roll(self):
+        """Works out the rates of the last interval, returns False until it is over."""
+        now = time.monotonic()
+        elapsed = now - self.last_roll
+        if elapsed < INTERVAL:
+            return False
+
+        clients = {}
+        for address, traffic in self.traffic.items():
+            last = self.last_traffic.get(address, (0, 0, 0, 0))
+            clients[f'{address[0]}:{address[1]}'] = dict(zip(
+                ('bytes_out', 'packets_out', 'bytes_in', 'packets_in'),
+                ((new - old) / elapsed for new, old in zip(traffic, last)),
+            ))
+        overruns = self.overruns - self.last_overruns
+        rejected = self.rejected_inputs - self.last_rejected
+        self.rates = {
+            'ticks': (self.ticks - self.last_ticks) / elapsed,
+            'overruns': overruns / elapsed,
+            'rejected_inputs': rejected / elapsed,
+            'bytes_out': sum(client['bytes_out'] for client in clients.values()),
+            'packets_out': sum(client['packets_out'] for client in clients.values()),
+            'clients': clients,
+        }
+        if overruns:
+            print(f'{overruns} of {self.ticks - self.last_ticks} ticks went over budget')
+        if rejected:
+            print(f'Rejected {rejected} input packets, the last from {self.rejected_from}')
+
+        self.last_traffic = {address: tuple(traffic) for address, traffic in self.traffic.items()}
+        self.last_ticks, self.last_overruns = self.ticks, self.overruns
+        self.last_rejected = self.rejected_inputs
+        self.last_roll = now
+        return True
+
+    def report(self):
+        return {
+            'uptime': time.time() - self.started,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'rejected_inputs': self.rejected_inputs,
+            'budget_ms': BUDGET * 1000,
+            'counts': self.counts,
+            'per_second': self.rates,
+            'phases': {name: histogram.to_dict() for name, histogram in self.phases.items()},
+        }
+
+    def to_bytes(self):
+        return json.dumps(self.report()).encode()
+
+    def dump(self, path):
+        # write next to it and move it over so readers never see half a file
+        with open(path + '.tmp', 'wb') as file:
+            file.write(self.to_bytes())
+        os.replace(path + '.tmp', path)
+
+
+class NoMetrics(Metrics):
+    """Used when nothing is listening, only keeps the clock going."""
+    def add(self, phase, seconds):
+        pass
+
+
+if __name__ == '__main__':
+    from server import localPort
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else localPort + STATS_PORT_OFFSET
+    stats = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    stats.settimeout(2)
+    stats.sendto(b'', ('127.0.0.1', port))
+    print(json.dumps(json.loads(stats.recv(0xffff)), indent=2))
@@ -0,0 +1,453 @@
+"""Players and projectiles in numpy arrays, see Field(vectorized=True)."""
+from itertools import repeat
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import weapons
+from constants import FIELD_SIZE
+from field import Player
+from grid import CELL_SIZE
+
+
+AVAILABLE = np is not None
+INITIAL_CAPACITY = 64
+
+
+class Rows:
+    """Things kept as the first count rows of the arrays named in ARRAYS."""
+    ARRAYS = ()
+    VECTORS = ()  # the ones with an x and a y
+
+    def __init__(self, capacity, **dtypes):
+        self.count = 0
+        for name in self.ARRAYS:
+            shape = (capacity, 2) if name in self.VECTORS else capacity
+            setattr(self, name, np.zeros(shape, dtype=dtypes.get(name, float)))
+
+    def grow(self):
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate((array, np.zeros_like(array))))
+
+    def new_row(self):
+        if self.count == len(getattr(self, self.ARRAYS[0])):
+            self.grow()
+        self.count += 1
+        return self.count - 1
+
+    def keep(self, mask):
+        """Only keeps the rows where mask is set, in the same order."""
+        kept = int(np.count_nonzero(mask))
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            array[:kept] = array[:self.count][mask]
+        self.count = kept
+
+
+class PlayerPhysics(Rows):
+    ARRAYS = (
+        'position', 'velocity', 'direction', 'acceleration', 'cool_down', 'points', 'damage'
+    )
+    VECTORS = ('position', 'velocity', 'direction')
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        super().__init__(capacity, cool_down=np.int64, points=np.int64, damage=np.int64)
+        self.players = []  # by slot
+
+    @property
+    def sizes(self):
+        # Player.size of every row
+        score = self.points[:self.count] - self.damage[:self.count]
+        return np.maximum(score, 0) + Player.INIT_SIZE
+
+    def add(self, player):
+        self.players.append(player)
+        return self.new_row()
+
+    def remove(self, player):
+        # the last row moves into the hole so the rows stay contiguous
+        slot, last = player.slot, self.count - 1
+        if slot != last:
+            for name in self.ARRAYS:
+                array = getattr(self, name)
+                array[slot] = array[last]
+            moved = self.players[slot] = self.players[last]
+            moved.slot = slot
+        self.players.pop()
+        self.count -= 1
+
+    def step(self):
+        """Moves every player like Player does, returns how many hit a wall."""
+        n = self.count
+        position = self.position[:n]
+        velocity = self.velocity[:n]
+        acceleration = self.acceleration[:n]
+
+        accelerating = acceleration != 0
+        velocity[accelerating] += (
+            self.direction[:n][accelerating]
+            * (acceleration[accelerating] / Player.ACCELERATION_FACTOR)[:, None]
+        )
+        speed = np.hypot(velocity[:, 0], velocity[:, 1])
+        too_fast = accelerating & (speed > Player.MAX_VELOCITY)
+        velocity[too_fast] *= (Player.MAX_VELOCITY / speed[too_fast])[:, None]
+        acceleration *= Player.FRICTION
+
+        position += velocity
+        np.clip(position, 0, FIELD_SIZE, out=position)
+        velocity *= Player.FRICTION
+
+        cool_down = self.cool_down[:n]
+        cool_down[cool_down > 0] -= 1
+
+        sizes = self.sizes[:, None]
+        over = position + sizes - FIELD_SIZE
+        under = sizes - position
+        high = over > 0
+        low = ~high & (under > 0)
+        velocity -= np.where(high, over, 0)
+        velocity += np.where(low, under, 0)
+        return int(np.count_nonzero((high | low).any(axis=1)))
+
+
+def component_property(name, axis):
+    def get(self):
+        return float(getattr(self.physics, name)[self.slot, axis])
+
+    def set(self, value):
+        getattr(self.physics, name)[self.slot, axis] = value
+
+    return property(get, set)
+
+
+def number_property(name, type_):
+    def get(self):
+        return type_(getattr(self.physics, name)[self.slot])
+
+    def set(self, value):
+        getattr(self.physics, name)[self.slot] = value
+
+    return property(get, set)
+
+
+class ArrayPlayer(Player):
+    __slots__ = ('physics', 'slot')
+    x = component_property('position', 0)
+    y = component_property('position', 1)
+    vx = component_property('velocity', 0)
+    vy = component_property('velocity', 1)
+    dx = component_property('direction', 0)
+    dy = component_property('direction', 1)
+    acceleration = number_property('acceleration', float)
+    cool_down = number_property('cool_down', int)
+    points = number_property('points', int)
+    damage = number_property('damage', int)
+
+    def __init__(self, field, name, *args, **kwargs):
+        # __init__ is called again when the player respawns, it keeps its row
+        if not hasattr(self, 'slot'):
+            self.physics = field.physics
+            self.slot = self.physics.add(self)
+        super().__init__(field, name, *args, **kwargs)
+
+
+class ProjectileGroup(Rows):
+    """The projectiles of one weapon."""
+    ARRAYS = (
+        'net_id', 'parent', 'position', 'velocity', 'colour', 'time_to_live',
+        'size', 'damage', 'impact',
+    )
+    VECTORS = ('position', 'velocity')
+
+    def __init__(self, weapon, capacity=INITIAL_CAPACITY):
+        super().__init__(
+            capacity, net_id=np.int64, parent=np.int64, colour=np.int64,
+            time_to_live=np.int64, damage=np.int64,
+        )
+        self.weapon = weapon
+
+    def append(self, projectile):
+        row = self.new_row()
+        self.net_id[row] = projectile.net_id
+        self.parent[row] = projectile.parent_index
+        self.position[row] = (projectile.x, projectile.y)
+        self.velocity[row] = (projectile.vx, projectile.vy)
+        self.colour[row] = projectile.colour
+        self.time_to_live[row] = projectile.time_to_live
+        self.size[row] = projectile.size
+        self.damage[row] = projectile.damage
+        self.impact[row] = projectile.impact
+
+    def items(self):
+        """(net id, Weapon.to_values) of every projectile."""
+        n = self.count
+        return zip(self.net_id[:n].tolist(), zip(
+            self.parent[:n].tolist(), repeat(self.weapon.WEAPON_ID, n),
+            *self.position[:n].T.tolist(), *self.velocity[:n].T.tolist(),
+            self.colour[:n].tolist(), self.time_to_live[:n].tolist(),
+            self.size[:n].astype(np.int64).tolist(),
+        ))
+
+    def near(self, positions, radius, rows=None):
+        """Players, projectiles, offsets and distances squared of pairs that can be in radius."""
+        if rows is None:
+            rows = np.arange(self.count)
+        players, projectiles = cell_pairs(positions, self.position[rows], radius)
+        projectiles = rows[projectiles]
+        offset = positions[players] - self.position[projectiles]
+        return players, projectiles, offset, (offset ** 2).sum(axis=1)
+
+
+def cells(positions, cell_size):
+    # like grid.Grid.cell for every position
+    return (np.clip(positions, 0, FIELD_SIZE) // cell_size).astype(np.int64)
+
+
+def cell_pairs(a, b, radius):
+    """Indices into a and b of the positions in neighbouring cells, sorted by a then b."""
+    cell_size = max(CELL_SIZE, radius)
+    width = int(FIELD_SIZE // cell_size) + 3  # a cell around the field too
+    a_cells, b_cells = cells(a, cell_size) + 1, cells(b, cell_size) + 1
+    a_keys = a_cells[:, 0] * width + a_cells[:, 1]
+    order = np.argsort(a_keys, kind='stable')
+    a_keys = a_keys[order]
+
+    found_a, found_b = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = (b_cells[:, 0] + dx) * width + b_cells[:, 1] + dy
+            start = np.searchsorted(a_keys, keys, 'left')
+            counts = np.searchsorted(a_keys, keys, 'right') - start
+            total = int(counts.sum())
+            if total:
+                ends = np.cumsum(counts)
+                found_a.append(order[
+                    np.arange(total) + np.repeat(start - ends + counts, counts)
+                ])
+                found_b.append(np.repeat(np.arange(len(b)), counts))
+    if not found_a:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    found_a, found_b = np.concatenate(found_a), np.concatenate(found_b)
+    by_a = np.lexsort((found_b, found_a))
+    return found_a[by_a], found_b[by_a]
+
+
+def fade(colour, step, limit, add):
+    # colour channels go up or down by step and stop at limit, see Flame.tick
+    channels = []
+    for mask, channel_step, channel_limit in zip((0xff0000, 0x00ff00, 0x0000ff), step, limit):
+        if add:
+            channels.append(np.minimum((colour & mask) + channel_step, channel_limit))
+        else:
+            channels.append(np.maximum((colour & mask) - channel_step, channel_limit))
+    return channels[0] | channels[1] | channels[2]
+
+
+def tick_moving(group):
+    group.position[:group.count] += group.velocity[:group.count]
+
+
+def tick_flame(group):
+    n = group.count
+    group.position[:n] += group.velocity[:n]
+    group.velocity[:n] *= 0.99
+    group.size[:n] += 0.3
+    group.colour[:n] = fade(
+        group.colour[:n], (0x010000, 0x000200, 0x000004), (0x001000, 0x000100, 0x000001), False
+    )
+
+
+def tick_mine(group):
+    n = group.count
+    ttl = group.time_to_live[:n]
+    colour = group.colour[:n]
+    end = int(weapons.Mine.DURATION * 0.05)
+    exploding = ttl < end
+    colour[ttl == end] = 0x000000
+    colour[exploding] = fade(
+        colour[exploding], (0x050000, 0x000500, 0x000007), (0xff0000, 0x00ff00, 0x0000ff), True
+    )
+    group.size[:n][exploding] += 2
+    colour[(ttl > end) & (ttl < int(weapons.Mine.DURATION * 0.2))] = 0xf00000
+    colour[ttl >= int(weapons.Mine.DURATION * 0.2)] = 0xffffff
+
+
+def tick_meltdown(group):
+    n = group.count
+    group.size[:n] += 0.3
+    group.colour[:n] = fade(
+        group.colour[:n], (0x010000, 0x000300, 0x000002), (0xff0000, 0x00ff00, 0x0000ff), True
+    )
+
+
+def units(offset, distance_sq):
+    # offset.unit, zero when there is no direction
+    length = np.sqrt(distance_sq)
+    return np.divide(offset, length[:, None], out=np.zeros_like(offset), where=length[:, None] > 0)
+
+
+def hit_bullet(group, physics, slots, names, positions, sizes):
+    players, projectiles, offset, distance_sq = group.near(positions, sizes.max())
+    hits = (group.parent[projectiles] != names[players]) & (distance_sq < sizes[players] ** 2)
+    players, projectiles = players[hits], projectiles[hits]
+    np.add.at(
+        physics.velocity, slots[players],
+        group.velocity[projectiles] * group.impact[projectiles, None],
+    )
+    group.time_to_live[projectiles] = 0
+    return zip(players.tolist(), group.damage[projectiles].tolist())
+
+
+def hit_flame(group, physics, slots, names, positions, sizes):
+    n = group.count
+    players, projectiles, offset, distance_sq = group.near(
+        positions, sizes.max() + group.size[:n].max()
+    )
+    hits = distance_sq < sizes[players] ** 2 + group.size[projectiles] ** 2
+    players, projectiles = players[hits], projectiles[hits]
+    speed = np.hypot(*group.velocity[projectiles].T)
+    np.add.at(
+        physics.velocity, slots[players],
+        units(offset[hits], distance_sq[hits]) * (speed * group.impact[projectiles])[:, None],
+    )
+    group.time_to_live[projectiles] = 0
+    return zip(players.tolist(), group.damage[projectiles].tolist())
+
+
+def hit_mine(group, physics, slots, names, positions, sizes):
+    ttl = group.time_to_live[:group.count]
+    armed = np.flatnonzero(ttl <= int(weapons.Mine.SAFE_DURATION))
+    if not armed.size:
+        return ()
+    players, projectiles, offset, distance_sq = group.near(
+        positions,
+        max(weapons.Mine.DETECTION_RADIUS, sizes.max() + group.size[armed].max()),
+        armed,
+    )
+    detected = projectiles[distance_sq < weapons.Mine.DETECTION_RADIUS ** 2]
+    ttl[detected] = np.minimum(ttl[detected], int(weapons.Mine.DURATION * 0.1))
+
+    hits = (
+        (ttl[projectiles] == 0)
+        & (distance_sq < (sizes[players] + group.size[projectiles]) ** 2)
+    )
+    players, projectiles = players[hits], projectiles[hits]
+    np.add.at(
+        physics.velocity, slots[players], units(offset[hits], distance_sq[hits]) * 30,
+    )
+    return zip(players.tolist(), group.damage[projectiles].tolist())
+
+
+def hit_freeze(group, physics, slots, names, positions, sizes):
+    n = group.count
+    players, projectiles, offset, distance_sq = group.near(
+        positions, sizes.max() + group.size[:n].max()
+    )
+    hits = (
+        (group.parent[projectiles] != names[players])
+        & (distance_sq < (sizes[players] + group.size[projectiles]) ** 2)
+    )
+    for player, projectile in zip(players[hits], projectiles[hits]):
+        group.velocity[projectile] = 0
+        group.position[projectile] = positions[player]
+        group.colour[projectile] = 0xd0d0ff
+        group.size[projectile] = sizes[player]
+        group.time_to_live[projectile] -= 1
+        physics.velocity[slots[player]] *= 0.94
+    return ()  # freezing does no damage
+
+
+def hit_meltdown(group, physics, slots, names, positions, sizes):
+    n = group.count
+    # it stays on its parent until it goes off
+    parent = group.parent[:n]
+    index = np.full(max(names.max(), parent.max()) + 1, -1)
+    index[names] = np.arange(len(names))
+    parents = index[parent]
+    on_parent = parents >= 0
+    group.position[:n][on_parent] = positions[parents[on_parent]]
+
+    going_off = np.flatnonzero(group.time_to_live[:n] == 0)
+    if not going_off.size:
+        return ()
+    players, projectiles, offset, distance_sq = group.near(
+        positions, sizes.max() + group.size[going_off].max(), going_off
+    )
+    hits = distance_sq < (sizes[players] + group.size[projectiles]) ** 2
+    return zip(players[hits].tolist(), group.damage[projectiles[hits]].tolist())
+
+
+TICKS = {
+    weapons.Flame: tick_flame,
+    weapons.Mine: tick_mine,
+    weapons.Meltdown: tick_meltdown,
+}
+HITS = {
+    weapons.Flame: hit_flame,
+    weapons.Mine: hit_mine,
+    weapons.Freeze: hit_freeze,
+    weapons.Meltdown: hit_meltdown,
+}
+
+
+class ProjectileSystem:
+    """The list of projectiles of a vectorized Field, one group per weapon."""
+    def __init__(self):
+        self.groups = [ProjectileGroup(weapon) for _, weapon in sorted(weapons.WEAPON_LOOKUP.items())]
+        self.by_id = {group.weapon.WEAPON_ID: group for group in self.groups}
+
+    def __len__(self):
+        return sum(group.count for group in self.groups)
+
+    def __iter__(self):
+        # copies, changing them does not change the projectiles
+        for net_id, values in self.items():
+            yield weapons.from_values(net_id, values)
+
+    def append(self, projectile):
+        self.by_id[projectile.WEAPON_ID].append(projectile)
+
+    def clear(self):
+        for group in self.groups:
+            group.count = 0
+
+    def items(self):
+        for group in self.groups:
+            yield from group.items()
+
+    def remove_parent(self, index):
+        # the projectiles of a player that left go with it, see Field.remove
+        for group in self.groups:
+            parent = group.parent[:group.count]
+            keep = parent != index
+            parent[parent > index] -= 1
+            group.keep(keep)
+
+    def hits(self, players, physics):
+        """Yields (player, damage) for every hit that did damage, a weapon at a time."""
+        if not players:
+            return
+        slots = np.fromiter((player.slot for player in players), np.int64, len(players))
+        names = np.fromiter((player.name for player in players), np.int64, len(players))
+        for group in self.groups:
+            if group.count:
+                positions = physics.position[slots]
+                sizes = physics.sizes[slots]
+                hits = list(HITS.get(group.weapon, hit_bullet)(
+                    group, physics, slots, names, positions, sizes
+                ))
+                for i, damage in hits:
+                    if damage:
+                        yield players[i], damage
+
+    def tick(self):
+        for group in self.groups:
+            if group.count:
+                TICKS.get(group.weapon, tick_moving)(group)
+                ttl = group.time_to_live[:group.count]
+                alive = ttl > 0
+                ttl[alive] -= 1
+                group.keep(alive)
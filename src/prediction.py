@@ -0,0 +1,40 @@
+"""
+Client side prediction. Inputs are numbered and kept until a snapshot says
+the server has applied them. When one does, the own player has just been
+reset to the state of the server and the inputs it has not seen yet are
+played again on top of it.
+"""
+from collections import deque
+
+import action
+
+
+INPUT_HISTORY = 256
+
+
+class Predictor:
+    def __init__(self):
+        self.seq = 0
+        self.inputs = deque(maxlen=INPUT_HISTORY)  # (seq, action value)
+        self.actions = action.ActionStatus()
+
+    def record(self, action_value):
+        self.seq += 1
+        self.inputs.append((self.seq, action_value))
+        return self.seq
+
+    def unacked(self):
+        """Action values the server has not applied yet, oldest first."""
+        return [action_value for _, action_value in self.inputs]
+
+    def reconcile(self, player, input_ack):
+        while self.inputs and self.inputs[0][0] <= input_ack:
+            self.inputs.popleft()
+        for _, action_value in self.inputs:
+            self.actions.set_action_value(action_value)
+            turn, forward, _, _ = self.actions.as_tuple
+            # shooting and switching weapons are left to the server
+            player.steer(turn, forward)
+            player.accelerate()
+            player.move()
+            player.wall_bounce()
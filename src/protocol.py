@@ -0,0 +1,60 @@
+from struct import pack, unpack, calcsize
+
+from action import Action
+
+
+MSG_CONNECT = 0
+MSG_INPUT = 1
+MSG_SNAPSHOT = 2
+MSG_SNAPSHOT_V2 = 3
+MSG_SNAPSHOT_V3 = 4
+MSG_INPUTS = 5
+
+MAX_PACKET_SIZE = 1024
+
+# MSG_INPUT: type, action, newest snapshot the client has received in full,
+# input seq
+SINGLE_INPUT_FORMAT = '<BBII'
+SINGLE_INPUT_LEN = calcsize(SINGLE_INPUT_FORMAT)
+# MSG_INPUTS: type, newest snapshot the client has received in full, newest
+# input seq, input count, followed by that many actions with the newest last
+INPUT_FORMAT = '<BIIB'
+INPUT_LEN = calcsize(INPUT_FORMAT)
+# every input is sent this many times so a lost packet does not lose it
+INPUT_REDUNDANCY = 8
+ACTION_MASK = (1 << len(Action)) - 1  # bits of an action value, the rest are dropped
+
+
+def encode_connect(version):
+    return bytes((MSG_CONNECT, version))
+
+
+def decode_connect(message):
+    # the first clients did not send a version
+    return message[1] if len(message) > 1 else 1
+
+
+def encode_input(action_values, ack, seq):
+    """action_values are the inputs up to and including seq, oldest first."""
+    action_values = action_values[-INPUT_REDUNDANCY:]
+    return pack(INPUT_FORMAT, MSG_INPUTS, ack, seq, len(action_values)) + bytes(action_values)
+
+
+def decode_input(message):
+    """
+    Returns the ack and a list of (seq, action value), oldest first. Raises
+    ValueError for anything that is not a whole MSG_INPUT or MSG_INPUTS.
+    """
+    kind = message[0] if message else None
+    if kind == MSG_INPUT and len(message) == SINGLE_INPUT_LEN:
+        # clients from before MSG_INPUTS send one action at a time
+        _, action_value, ack, seq = unpack(SINGLE_INPUT_FORMAT, message)
+        return ack, [(seq, action_value & ACTION_MASK)]
+    if kind != MSG_INPUTS or len(message) < INPUT_LEN:
+        raise ValueError(f'not an input message, type {kind} of {len(message)} bytes')
+    _, ack, seq, count = unpack(INPUT_FORMAT, message[:INPUT_LEN])
+    action_values = message[INPUT_LEN:]
+    if len(action_values) != count:
+        raise ValueError(f'{count} inputs announced, {len(action_values)} sent')
+    first = seq - count + 1
+    return ack, [(first + i, value & ACTION_MASK) for i, value in enumerate(action_values)]
@@ -0,0 +1,52 @@
+"""
+Precompiled structs for sending entities, see to_values and FIELDS.
+
+A record is the key of an entity (player index or projectile net id)
+followed by its values. Whole lists of records are packed into and unpacked
+from one buffer with a single call.
+"""
+from functools import lru_cache
+from itertools import chain
+from struct import Struct
+
+
+@lru_cache(maxsize=256)
+def repeated(record_format, count):
+    return Struct('<' + record_format.lstrip('<') * count)
+
+
+class Records:
+    def __init__(self, key_format, fields):
+        self.key_format = key_format
+        self.fields = fields
+        self.full_mask = (1 << len(fields)) - 1
+        self.key = Struct('<' + key_format)
+        self.prefix = Struct('<' + key_format + 'H')  # key and mask of changed fields
+        self.values = Struct('<' + fields)
+        self.record = Struct('<' + key_format + fields)
+        self._deltas = {}
+
+    def delta(self, mask):
+        """Struct of a record with only the fields in mask, after the prefix."""
+        struct = self._deltas.get(mask)
+        if struct is None:
+            changed = ''.join(c for i, c in enumerate(self.fields) if mask >> i & 1)
+            struct = Struct(self.prefix.format + changed)
+            self._deltas[mask] = struct
+        return struct
+
+    def size(self, count):
+        return count * self.record.size
+
+    def pack_into(self, buffer, offset, items):
+        """Packs (key, values) items as records, returns the offset after them."""
+        repeated(self.record.format, len(items)).pack_into(
+            buffer, offset, *chain.from_iterable((key, *values) for key, values in items)
+        )
+        return offset + self.size(len(items))
+
+    def unpack_from(self, source_bytes, offset, count):
+        """(key, values) of count records, returns them and the offset after them."""
+        end = offset + self.size(count)
+        records = self.record.iter_unpack(memoryview(source_bytes)[offset:end])
+        return [(record[0], record[1:]) for record in records], end
@@ -0,0 +1,143 @@
+"""
+Match recording and replay.
+
+A recording is the state of the field when it started, the seeds of the
+game's randomness and everything that was done to the field after that:
+steering, players joining and leaving, by tick. Bots are recorded as the
+steering they did, so replaying does not need them.
+
+It is a file of JSON lines, a header and then one line per tick in which
+something happened:
+
+    [tick, [["steer", index, turn, forward, shoot, switch], ["join"], ["leave", index]], check]
+
+check is a checksum of the field before that tick is simulated, every
+CHECK_INTERVAL ticks. A replay that does not match it has desynced.
+
+    python replay.py match.rec  # replays as fast as possible and times it
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+
+import snapshot
+import weapons
+from field import Field
+from metrics import Metrics
+
+
+FORMAT_VERSION = 2  # 2 has headings instead of directions
+CHECK_INTERVAL = 120  # ticks
+
+
+def checksum(field):
+    return zlib.crc32(repr(snapshot.capture(field)).encode())
+
+
+def seed(value):
+    random.seed(value)
+    weapons.seed_spread(value)
+
+
+class Recorder:
+    def __init__(self, path, field, seed_value=None):
+        if seed_value is None:
+            seed_value = int.from_bytes(os.urandom(4), 'little')
+        seed(seed_value)
+        self.file = open(path, 'w', buffering=1)
+        self.tick = 0
+        self.events = []
+
+        players, projectiles = snapshot.capture(field)
+        json.dump({
+            'version': FORMAT_VERSION,
+            'seed': seed_value,
+            'player_count': len(field.players),
+            'players': players,
+            'projectiles': projectiles,
+            'next_net_id': field.next_net_id,
+            'vectorized': field.physics is not None,
+        }, self.file)
+        self.file.write('\n')
+        field.recorder = self
+
+    def event(self, *event):
+        self.events.append(event)
+
+    def step(self, field):
+        """Called by the field before it simulates a tick."""
+        check = checksum(field) if self.tick % CHECK_INTERVAL == 0 else None
+        if self.events or check is not None:
+            json.dump([self.tick, self.events, check], self.file)
+            self.file.write('\n')
+            self.events = []
+        self.tick += 1
+
+    def close(self):
+        self.file.close()
+
+
+def load(path):
+    with open(path) as file:
+        header = json.loads(next(file))
+        if header['version'] != FORMAT_VERSION:
+            raise ValueError(f'Recording is version {header["version"]}')
+        return header, [json.loads(line) for line in file]
+
+
+def start(header):
+    field = Field(vectorized=header['vectorized'])
+    players = {int(i): values for i, values in header['players'].items()}
+    projectiles = {int(net_id): values for net_id, values in header['projectiles'].items()}
+    field.from_values(players, projectiles, header['player_count'])
+    field.next_net_id = header['next_net_id']
+    field.status = []
+    # after from_values, making the players used up some randomness
+    seed(header['seed'])
+    return field
+
+
+def replay(path, metrics=None):
+    """
+    Runs the recording without any pacing, returns the field, the number of
+    ticks and the ticks where the checksum did not match.
+    """
+    header, ticks = load(path)
+    field = start(header)
+    if metrics is not None:
+        field.metrics = metrics
+
+    desyncs = []
+    tick = 0
+    for recorded_tick, events, check in ticks:
+        while tick < recorded_tick:
+            field.step()
+            tick += 1
+        for name, *args in events:
+            if name == 'steer':
+                field.steer(*args)
+            elif name == 'join':
+                field.new_player()
+            elif name == 'leave':
+                field.remove(*args)
+        if check is not None and check != checksum(field):
+            desyncs.append(tick)
+    return field, tick, desyncs
+
+
+if __name__ == '__main__':
+    metrics = Metrics()
+    start_time = time.perf_counter()
+    field, ticks, desyncs = replay(sys.argv[1], metrics)
+    elapsed = time.perf_counter() - start_time
+
+    print(f'{ticks} ticks in {elapsed:.2f}s, {ticks / elapsed:.0f} ticks/s')
+    for name, histogram in metrics.phases.items():
+        print(f'{name:16} mean {histogram.total / histogram.count:.3f}ms max {histogram.max:.3f}ms')
+    if desyncs:
+        print(f'Desynced, checksums differ at ticks {desyncs[:10]}')
+    else:
+        print('No desyncs')
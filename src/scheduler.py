@@ -0,0 +1,40 @@
+"""Fixed timestep, tick n is due at start + n * interval."""
+import time
+
+from constants import TICK_RATE
+
+
+MAX_CATCH_UP = 5  # ticks run back to back at most after a stall
+
+
+class Scheduler:
+    def __init__(self, rate=TICK_RATE, max_catch_up=MAX_CATCH_UP):
+        self.interval = 1 / rate
+        self.max_catch_up = max_catch_up
+        self.start = time.monotonic()
+        self.ticks = 0  # ticks that are accounted for, run or dropped
+        self.late = 0  # ticks that were run behind time to catch up
+        self.dropped = 0  # ticks that were skipped after a long stall
+
+    @property
+    def next_tick(self):
+        return self.start + self.ticks * self.interval
+
+    def timeout(self):
+        """Seconds until the next tick is due."""
+        return max(self.next_tick - time.monotonic(), 0)
+
+    def due(self):
+        """How many ticks to run now."""
+        behind = int((time.monotonic() - self.start) / self.interval) + 1 - self.ticks
+        if behind <= 0:
+            return 0
+        if behind > self.max_catch_up:
+            self.dropped += behind - self.max_catch_up
+            print(f'Dropped {behind - self.max_catch_up} ticks')
+            behind = self.max_catch_up
+            # start counting from now, the dropped ticks are not coming back
+            self.start = time.monotonic() - (self.ticks + behind - 1) * self.interval
+        self.late += behind - 1
+        self.ticks += behind
+        return behind
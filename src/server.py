@@ -1,12 +1,22 @@
-import time
-import random
 import socket
-from threading import Thread
+import argparse
+import struct
+import selectors
+from collections import deque
+from time import perf_counter
 
-import pygame
 import action
+import ai
+import codec
+import protocol
+import replay
+import snapshot
+from metrics import Metrics, STATS_PORT_OFFSET
+from scheduler import Scheduler
 
-from constants import FIELD_SIZE, SCREEN_SIZE
+from constants import (
+    FIELD_SIZE, SCREEN_SIZE, TICK_RATE, INTEREST_RADIUS, SNAPSHOT_RATE, VECTORIZED_PHYSICS
+)
 from field import *
 
 
@@ -15,86 +25,275 @@ localPort = 63834
 bufferSize = 1024
 
 NUM_BOTS = 3
-MAX_TTL = 3000
-
-UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-UDPServerSocket.bind((localIP, localPort))
-print("UDP server up and listening")
-
-
-def ai_thread(field, index):
-    # ai is the OBJECT of the player you want to steer
-    field.new_player()
-    while 1:
-        ai_player = field.players[index]
-        target = ai_player.target
-        target_dir = (target.position + target.velocity*60 + target.direction*target.acceleration*60 - ai_player.position)
-        current_dir = ai_player.direction
-        direction = -int(current_dir[0] * target_dir[1] - current_dir[1] * target_dir[0])
-        shoot = 1 if random.randint(0, 200) == 2 else 0
-        switch = 1 if random.randint(0, 500) == 2 else 0
-        move = 1 if target_dir.length_squared > 900 else 0
-        field.steer(index, direction, move, shoot, switch)
-        time.sleep(0.01)
-
-
-max_length = 1024
-def flood(connections, connections_ttl, bytes_to_send):
-    try:
-        if len(bytes_to_send) > max_length:
-            print(f'Max length exceeded, skipping packet {len(bytes_to_send)}')
-            return
-
-        for i in range(len(connections)):
-            bytes_to_send += (i + NUM_BOTS).to_bytes(1, 'big')
-            UDPServerSocket.sendto(bytes_to_send, connections[i])
-            connections_ttl[i] -= 1
-    except IndexError:
-        print('Index error in flood')
-
-
-def game_thread(field, connections, connections_ttl):
-    tick = 0
-    clock = pygame.time.Clock()
-    while 1:
-        if tick % 1 == 0:
-            flood(connections, connections_ttl,  field.to_bytes())
-        field.tick()
-        tick += 1
-        clock.tick(128)
+MAX_TTL = 3000  # ticks without hearing from a client before it is dropped
+MAX_PLAYERS = 0xff  # player keys and counts are one byte on the wire
+MAX_CONNECTIONS = MAX_PLAYERS - NUM_BOTS
+MAX_QUEUED_INPUTS = 16  # a client that is this far ahead loses its oldest inputs
+STATS_HOST = '127.0.0.1'
+SENDMSG = hasattr(socket.socket, 'sendmsg')  # not on windows
 
 
-if __name__ == '__main__':
-    connections = []
-    connections_ttl = []
-    field = Field()
-    cur_actions = action.ActionStatus()
-
-    bot_threads = []
-    for bot_num in range(NUM_BOTS):
-        bot_threads.append(Thread(target=ai_thread, args=(field, bot_num, )))
-        bot_threads[bot_num].start()
-    game_thread = Thread(target=game_thread, args=(field, connections, connections_ttl, ))
-    game_thread.start()
-
-    while len(connections) < 255:
-        bytesAddressPair = UDPServerSocket.recvfrom(bufferSize)
-        message = bytesAddressPair[0]
-        address = bytesAddressPair[1]
-        if address not in connections:
-            connections.append(address)
-            connections_ttl.append(MAX_TTL)
-            field.new_player()
-
-        index = connections.index(address)
-        connections_ttl[index] = MAX_TTL
-        if len(message) == 1:
-            cur_actions.set_action_value(message[0])
-            field.steer(index + NUM_BOTS, *cur_actions.as_tuple)
-
-        for i in range(len(connections_ttl)):
-            if connections_ttl[i] < 0:
-                del connections_ttl[i]
-                del connections[i]
-                field.remove(i + NUM_BOTS)
+class Connection:
+    def __init__(self, address, version=1):
+        self.address = address
+        self.codec = codec.negotiate(version)
+        self.ttl = MAX_TTL
+        self.ack = 0  # newest snapshot the client has received
+        self.input_seq = 0  # newest input that was applied
+        self.received_seq = 0  # newest input that was received
+        self.inputs = deque(maxlen=MAX_QUEUED_INPUTS)  # (seq, action value)
+        self.history = {}  # what the client was sent, by seq
+
+
+class Server:
+    """
+    Single threaded game server. Receiving, simulating and sending are all
+    multiplexed on one selector loop with a fixed timestep, so nothing else
+    ever touches the field.
+    """
+    def __init__(
+            self, field, address=(localIP, localPort),
+            interest_radius=INTEREST_RADIUS, num_bots=NUM_BOTS,
+            stats_port=None, metrics_file=None, record=None,
+    ):
+        """
+        Anything sent to the stats socket on stats_port, by default the game
+        port plus STATS_PORT_OFFSET, is answered with the metrics as JSON.
+        With a metrics_file they are also written there every interval.
+        With record the match is recorded to that file, see replay.
+        """
+        if num_bots > MAX_PLAYERS:
+            raise ValueError(f'At most {MAX_PLAYERS} players fit in a match, not {num_bots} bots')
+        self.field = field
+        self.interest_radius = interest_radius
+        self.num_bots = num_bots
+        self.connections = []
+        self.cur_actions = action.ActionStatus()
+        self.metrics = field.metrics = Metrics()
+        self.metrics_file = metrics_file
+
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(address)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ)
+
+        self.stats_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.stats_socket.setblocking(False)
+        try:
+            self.stats_socket.bind((STATS_HOST, stats_port or address[1] + STATS_PORT_OFFSET))
+            self.selector.register(self.stats_socket, selectors.EVENT_READ)
+        except OSError as e:
+            print(f'No stats socket: {e}')
+
+        self.recorder = None if record is None else replay.Recorder(record, field)
+
+        # bots are the first players, the connections come after them
+        for _ in range(num_bots):
+            self.field.new_player()
+        self.bots = ai.Bots(range(num_bots))
+
+        self.tick_count = 0
+        self.seq = 0
+        self.scheduler = Scheduler(TICK_RATE)
+        self.snapshot_interval = max(TICK_RATE // SNAPSHOT_RATE, 1)  # in ticks
+        self.next_snapshot = 0
+
+    def receive(self):
+        while 1:
+            try:
+                message, address = self.socket.recvfrom(bufferSize)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                # windows reports ICMP port unreachable from an earlier send here
+                continue
+            self.metrics.received(address, len(message))
+            self.handle(message, address)
+
+    def answer_stats(self):
+        while 1:
+            try:
+                _, address = self.stats_socket.recvfrom(bufferSize)
+                self.stats_socket.sendto(self.metrics.to_bytes(), address)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print(f'Could not answer stats: {e}')
+                return
+
+    def find(self, address):
+        for i, connection in enumerate(self.connections):
+            if connection.address == address:
+                return i
+        return -1
+
+    def handle(self, message, address):
+        version = 1
+        if message and message[0] == protocol.MSG_CONNECT:
+            version = protocol.decode_connect(message)
+
+        index = self.find(address)
+        if index == -1:
+            if (
+                len(self.connections) >= MAX_CONNECTIONS
+                or len(self.field.players) >= MAX_PLAYERS
+            ):
+                return
+            index = len(self.connections)
+            self.connections.append(Connection(address, version))
+            self.field.new_player()
+        elif message and message[0] == protocol.MSG_CONNECT:
+            # reconnecting, the old baselines might be in another version
+            self.connections[index] = Connection(address, version)
+
+        connection = self.connections[index]
+        connection.ttl = MAX_TTL
+        if message and message[0] != protocol.MSG_CONNECT:
+            try:
+                ack, inputs = protocol.decode_input(message)
+            except ValueError:
+                self.metrics.rejected(address)
+                return
+            connection.ack = max(connection.ack, ack)
+            # the redundant copies fill in for lost packets, inputs are only
+            # queued here and applied one per tick in apply_inputs
+            for input_seq, action_value in inputs:
+                if input_seq > connection.received_seq:
+                    connection.received_seq = input_seq
+                    connection.inputs.append((input_seq, action_value))
+
+    def apply_inputs(self):
+        for i, connection in enumerate(self.connections):
+            if connection.inputs:
+                connection.input_seq, action_value = connection.inputs.popleft()
+                self.cur_actions.set_action_value(action_value)
+                self.field.steer(i + self.num_bots, *self.cur_actions.as_tuple)
+
+    def drop_expired(self):
+        for connection in self.connections:
+            connection.ttl -= 1
+        for i in range(len(self.connections)):
+            if self.connections[i].ttl < 0:
+                self.metrics.forget(self.connections[i].address)
+                del self.connections[i]
+                self.field.remove(i + self.num_bots)
                 break
+
+    def send(self, parts, address):
+        # errors only lose this one packet, everyone else still gets theirs
+        try:
+            if SENDMSG:
+                size = self.socket.sendmsg(parts, (), 0, address)
+            else:
+                size = self.socket.sendto(b''.join(parts), address)
+            self.metrics.sent(address, size)
+        except BlockingIOError:
+            print('Send buffer full in flood')
+        except OSError as e:
+            print(f'Could not send to {address}: {e}')
+
+    def flood(self, state):
+        start = perf_counter()
+        sending = 0  # time spent in send, the rest is serializing
+        player_count = len(self.field.players)
+        encoded = {}  # the state in every version that is in use
+        records = {}  # encoded records, shared by everyone with the same baseline
+        for i, connection in enumerate(self.connections):
+            index = i + self.num_bots
+            wire = connection.codec
+            if wire.VERSION not in encoded:
+                encoded[wire.VERSION] = wire.encode_state(state)
+            visible = snapshot.subset(
+                encoded[wire.VERSION],
+                snapshot.interest(state, index, self.interest_radius),
+            )
+            baseline = connection.history.get(connection.ack)
+            # a snapshot that cannot be encoded only costs this client its
+            # snapshot, it is not added to the history either
+            try:
+                if baseline is None:
+                    packets = snapshot.encode_parts(
+                        wire, self.seq, index, player_count, visible,
+                        input_seq=connection.input_seq,
+                    )
+                else:
+                    packets = snapshot.encode_parts(
+                        wire, self.seq, index, player_count, visible,
+                        connection.ack, baseline, connection.input_seq, records,
+                    )
+            except (ValueError, struct.error) as e:
+                print(f'Could not encode a snapshot for {connection.address}: {e}')
+                continue
+            connection.history[self.seq] = visible
+            connection.history.pop(self.seq - snapshot.HISTORY_LENGTH, None)
+
+            send_start = perf_counter()
+            for parts in packets:
+                self.send(parts, connection.address)
+            sending += perf_counter() - send_start
+
+        self.metrics.add('serialize', perf_counter() - start - sending)
+        self.metrics.add('send', sending)
+
+    def send_snapshot(self):
+        self.seq += 1
+        start = perf_counter()
+        state = snapshot.capture(self.field)
+        self.metrics.phase('capture', start)
+        self.flood(state)
+        self.next_snapshot = self.tick_count + self.snapshot_interval
+
+    def step(self, send=True):
+        """
+        One tick of the simulation. Snapshots go out every snapshot interval
+        but not while catching up, only the last tick sends.
+        """
+        tick_start = start = perf_counter()
+        self.apply_inputs()
+        start = self.metrics.phase('inputs', start)
+        self.bots.step(self.field, self.tick_count)
+        self.metrics.phase('bots', start)
+        self.field.step()
+        self.drop_expired()
+        self.tick_count += 1
+
+        # snapshots are taken after the step so that every input they
+        # acknowledge has been simulated, clients replay the rest
+        if send and self.tick_count >= self.next_snapshot:
+            self.send_snapshot()
+
+        self.metrics.tick(
+            perf_counter() - tick_start,
+            players=len(self.field.players),
+            projectiles=len(self.field.projectiles),
+            connections=len(self.connections),
+            late_ticks=self.scheduler.late,
+            dropped_ticks=self.scheduler.dropped,
+        )
+        if self.metrics.roll() and self.metrics_file:
+            self.metrics.dump(self.metrics_file)
+
+    def run(self):
+        print("UDP server up and listening")
+        while 1:
+            for key, _ in self.selector.select(self.scheduler.timeout()):
+                if key.fileobj is self.socket:
+                    self.receive()
+                else:
+                    self.answer_stats()
+
+            ticks = self.scheduler.due()
+            for i in range(ticks):
+                self.step(send=i == ticks - 1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Game server.')
+    parser.add_argument('record', nargs='?', help='file to record the match to')
+    parser.add_argument('--metrics-file', help='file to dump the metrics to every second')
+    args = parser.parse_args()
+    Server(
+        Field(vectorized=VECTORIZED_PHYSICS),
+        metrics_file=args.metrics_file, record=args.record,
+    ).run()
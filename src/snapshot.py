@@ -0,0 +1,353 @@
+"""
+Delta compressed snapshots.
+
+The server keeps the state of the field for the last HISTORY_LENGTH
+snapshots. Every client acknowledges the newest snapshot it has received and
+is then only sent the fields that changed since that snapshot. When the
+acknowledged snapshot has fallen out of the history a full snapshot is sent.
+
+A state is a tuple of two dicts, players by index and projectiles by net id,
+holding the values returned by to_values encoded with the client's codec.
+
+Snapshots that do not fit in MAX_PACKET_SIZE are split into fragments. Every
+fragment only depends on the baseline so it can be applied on its own, a
+snapshot is only acknowledged once all of its fragments have arrived.
+
+Full snapshots (baseline 0) skip the masks, their fragments are plain lists
+of records, see records.Records.
+"""
+import heapq
+from itertools import chain
+from struct import Struct
+
+import protocol
+from codec import BY_MESSAGE
+
+
+HISTORY_LENGTH = 64
+MAX_FRAGMENTS = 0xff  # the fragment fields of the header are one byte
+# a client is only sent this many projectiles, the closest ones, so that a
+# snapshot stays well below MAX_FRAGMENTS even with a full match
+MAX_PROJECTILES = 400
+
+# type, seq, baseline seq, newest input applied, fragment, fragment count,
+# self index, player count, removed players, changed players,
+# removed projectiles, changed projectiles
+HEADER = Struct('<BIIIBBBBBBHH')
+
+EMPTY_STATE = ({}, {})
+
+# positions of things in the values, see to_values
+PLAYER_X, PLAYER_Y, PLAYER_TARGET = 0, 1, 8
+PROJECTILE_X, PROJECTILE_Y, PROJECTILE_SIZE = 2, 3, 8
+
+
+def capture(field):
+    players = {player.name: player.to_values() for player in field.players}
+    return players, field.projectile_values()
+
+
+def encode_record(records, key, values, base=None):
+    if base is None:
+        mask = records.full_mask
+        changed = values
+    else:
+        mask = 0
+        changed = []
+        for i, (value, old) in enumerate(zip(values, base)):
+            if value != old:
+                mask |= 1 << i
+                changed.append(value)
+        if not mask:
+            return None
+    return records.delta(mask).pack(key, mask, *changed)
+
+
+def decode_record(records, source_bytes, offset, base_values):
+    key, mask = records.prefix.unpack_from(source_bytes, offset)
+    delta = records.delta(mask)
+    changed = iter(delta.unpack_from(source_bytes, offset)[2:])
+    offset += delta.size
+
+    base = base_values.get(key)
+    if base is None:
+        if mask != records.full_mask:
+            raise ValueError(f'Delta for unknown entity {key}')
+        base = (None, ) * len(records.fields)
+    values = tuple(
+        next(changed) if mask >> i & 1 else old
+        for i, old in enumerate(base)
+    )
+    return key, values, offset
+
+
+def interest(state, index, radius, max_projectiles=MAX_PROJECTILES):
+    """
+    Keys of the things in state that the player at index cares about:
+    everything within radius of it, its target and the players that are
+    targeting it. Of the projectiles only the max_projectiles closest are
+    kept. Only works on states that are not encoded.
+    """
+    players, projectiles = state
+    me = players[index]
+    x, y = me[PLAYER_X], me[PLAYER_Y]
+    radius_sq = radius ** 2
+
+    visible_players = []
+    for i, values in players.items():
+        dx, dy = values[PLAYER_X] - x, values[PLAYER_Y] - y
+        if (
+            dx*dx + dy*dy < radius_sq
+            or i == me[PLAYER_TARGET]
+            or values[PLAYER_TARGET] == index
+        ):
+            visible_players.append(i)
+
+    visible_projectiles = []
+    for net_id, values in projectiles.items():
+        dx, dy = values[PROJECTILE_X] - x, values[PROJECTILE_Y] - y
+        distance_sq = dx*dx + dy*dy
+        if distance_sq < (radius + values[PROJECTILE_SIZE]) ** 2:
+            visible_projectiles.append((distance_sq, net_id))
+    if len(visible_projectiles) > max_projectiles:
+        visible_projectiles = heapq.nsmallest(max_projectiles, visible_projectiles)
+
+    return visible_players, [net_id for _, net_id in visible_projectiles]
+
+
+def subset(state, keys):
+    players, projectiles = state
+    player_keys, projectile_keys = keys
+    return (
+        {i: players[i] for i in player_keys},
+        {net_id: projectiles[net_id] for net_id in projectile_keys},
+    )
+
+
+def removed_keys(records, current, base, cache=None):
+    if cache is None:
+        return [records.key.pack(key) for key in base if key not in current]
+    removed = []
+    for key in base:
+        if key not in current:
+            if (records, key) not in cache:
+                cache[records, key] = records.key.pack(key)
+            removed.append(cache[records, key])
+    return removed
+
+
+def changed_records(records, current, base, cache=None):
+    """
+    With a cache the records are shared between everyone that has the same
+    base values, the values of a tick are the same tuples for every client
+    and so are the ones in their histories.
+    """
+    changed = []
+    for key, values in current.items():
+        old = base.get(key)
+        if cache is None:
+            record = encode_record(records, key, values, old)
+        else:
+            cached = cache.get((records, key, id(old)))
+            if cached is None or cached[0] is not old:
+                cached = cache[records, key, id(old)] = (
+                    old, encode_record(records, key, values, old)
+                )
+            record = cached[1]
+        if record is not None:
+            changed.append(record)
+    return changed
+
+
+def decode_removed(records, source_bytes, offset, current, count):
+    end = offset + count * records.key.size
+    for key, in records.key.iter_unpack(memoryview(source_bytes)[offset:end]):
+        current.pop(key, None)
+    return end
+
+
+def decode_changed(records, source_bytes, offset, current, base, count):
+    for _ in range(count):
+        key, values, offset = decode_record(records, source_bytes, offset, base)
+        current[key] = values
+    return offset
+
+
+def check_fragments(fragments):
+    if len(fragments) > MAX_FRAGMENTS:
+        raise ValueError(f'Snapshot needs {len(fragments)} fragments, at most {MAX_FRAGMENTS} fit')
+
+
+def encode_full(codec, seq, self_index, player_count, state, input_seq=0):
+    """
+    A snapshot without a baseline is every record in full, these are packed
+    straight into one buffer per fragment.
+    """
+    players, projectiles = (list(entities.items()) for entities in state)
+    room = protocol.MAX_PACKET_SIZE - HEADER.size
+    fragments = []
+    player_start = projectile_start = 0
+    while not fragments or player_start < len(players) or projectile_start < len(projectiles):
+        player_end = min(len(players), player_start + room // codec.PLAYERS.record.size)
+        space = room - codec.PLAYERS.size(player_end - player_start)
+        projectile_end = min(
+            len(projectiles), projectile_start + space // codec.PROJECTILES.record.size
+        )
+        fragments.append((
+            players[player_start:player_end],
+            projectiles[projectile_start:projectile_end],
+        ))
+        player_start, projectile_start = player_end, projectile_end
+    check_fragments(fragments)
+
+    packets = []
+    for i, (fragment_players, fragment_projectiles) in enumerate(fragments):
+        buffer = bytearray(
+            HEADER.size
+            + codec.PLAYERS.size(len(fragment_players))
+            + codec.PROJECTILES.size(len(fragment_projectiles))
+        )
+        HEADER.pack_into(
+            buffer, 0, codec.MSG_SNAPSHOT, seq, 0, input_seq, i, len(fragments),
+            self_index, player_count,
+            0, len(fragment_players), 0, len(fragment_projectiles),
+        )
+        offset = codec.PLAYERS.pack_into(buffer, HEADER.size, fragment_players)
+        codec.PROJECTILES.pack_into(buffer, offset, fragment_projectiles)
+        packets.append(buffer)
+    return packets
+
+
+def encode_parts(
+        codec, seq, self_index, player_count, state,
+        baseline_seq=0, baseline=None, input_seq=0, cache=None,
+):
+    """
+    Returns the list of fragments, each fits in one packet and is a list of
+    buffers for sendmsg, its header followed by the records. input_seq is
+    the newest input of the client that went into state. Records in cache
+    are reused and new ones are added to it, one cache is good for every
+    client in a tick.
+    """
+    if baseline is None:
+        return [
+            [packet]
+            for packet in encode_full(codec, seq, self_index, player_count, state, input_seq)
+        ]
+
+    players, projectiles = state
+    base_players, base_projectiles = baseline
+    sections = (
+        removed_keys(codec.PLAYERS, players, base_players, cache),
+        changed_records(codec.PLAYERS, players, base_players, cache),
+        removed_keys(codec.PROJECTILES, projectiles, base_projectiles, cache),
+        changed_records(codec.PROJECTILES, projectiles, base_projectiles, cache),
+    )
+
+    fragments = [tuple([] for _ in sections)]
+    size = HEADER.size
+    for section, items in enumerate(sections):
+        for item in items:
+            if size + len(item) > protocol.MAX_PACKET_SIZE and size > HEADER.size:
+                fragments.append(tuple([] for _ in sections))
+                size = HEADER.size
+            fragments[-1][section].append(item)
+            size += len(item)
+    check_fragments(fragments)
+
+    packets = []
+    for i, fragment in enumerate(fragments):
+        header = HEADER.pack(
+            codec.MSG_SNAPSHOT, seq, baseline_seq, input_seq, i, len(fragments),
+            self_index, player_count, *map(len, fragment),
+        )
+        packets.append([header, *chain.from_iterable(fragment)])
+    return packets
+
+
+class Receiver:
+    """
+    Client side of the snapshots, rebuilds full states from the deltas.
+    Snapshots that are still missing fragments are kept in pending.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.history = {}
+        self.pending = {}
+        self.ack = 0
+        self.newest = 0
+        self.input_ack = 0  # newest input of ours the server had applied
+
+    def decode_newest(self, packets):
+        """
+        Only decodes the packets of the newest snapshot among packets, after
+        a hitch there is no point in going through the ones before it.
+        """
+        newest = max(HEADER.unpack_from(packet)[1] for packet in packets)
+        decoded = None
+        for packet in packets:
+            if HEADER.unpack_from(packet)[1] == newest:
+                decoded = self.decode(packet) or decoded
+        return decoded
+
+    def decode(self, source_bytes):
+        """
+        Applies one fragment, returns the newest (possibly partial) state or
+        None if there is nothing new to show.
+        """
+        (
+            msg_type, seq, baseline_seq, input_seq, fragment, fragment_count,
+            self_index, player_count, removed_players, changed_players, removed_projectiles, changed_projectiles,
+        ) = HEADER.unpack_from(source_bytes)
+        codec = BY_MESSAGE[msg_type]
+        if seq <= self.ack:
+            return None  # duplicate or older than what we already have
+        if baseline_seq and baseline_seq not in self.history:
+            return None
+        base_players, base_projectiles = self.history.get(baseline_seq, EMPTY_STATE)
+
+        if seq not in self.pending:
+            self.pending[seq] = (dict(base_players), dict(base_projectiles), set())
+            for old_seq in [s for s in self.pending if s <= seq - HISTORY_LENGTH]:
+                del self.pending[old_seq]
+        players, projectiles, received = self.pending[seq]
+        if fragment in received:
+            return None
+        received.add(fragment)
+
+        if baseline_seq == 0:
+            records, offset = codec.PLAYERS.unpack_from(source_bytes, HEADER.size, changed_players)
+            players.update(records)
+            records, _ = codec.PROJECTILES.unpack_from(source_bytes, offset, changed_projectiles)
+            projectiles.update(records)
+        else:
+            offset = decode_removed(
+                codec.PLAYERS, source_bytes, HEADER.size, players, removed_players
+            )
+            offset = decode_changed(
+                codec.PLAYERS, source_bytes, offset, players, base_players, changed_players
+            )
+            offset = decode_removed(
+                codec.PROJECTILES, source_bytes, offset, projectiles, removed_projectiles
+            )
+            decode_changed(
+                codec.PROJECTILES, source_bytes, offset,
+                projectiles, base_projectiles, changed_projectiles,
+            )
+
+        state = (players, projectiles)
+        if len(received) == fragment_count:
+            self.history[seq] = state
+            self.ack = seq
+            for old_seq in [s for s in self.history if s <= seq - HISTORY_LENGTH]:
+                del self.history[old_seq]
+            for old_seq in [s for s in self.pending if s <= seq]:
+                del self.pending[old_seq]
+
+        if seq < self.newest:
+            return None  # an older snapshot, only worth finishing as a baseline
+        self.newest = seq
+        self.input_ack = input_seq
+        return self_index, player_count, codec.decode_state(state)
@@ -1,56 +1,116 @@
 import math
 import random
-import struct
-from struct import pack, unpack, error
+from collections import defaultdict
 
-import matrixx
 from matrixx import Vector
-from matrixx import M2
 
+import angles
+from records import Records
 
-def from_bytes(players, source_bytes):
-    parent = players[source_bytes[0]]
-    projectile = WEAPON_LOOKUP[source_bytes[1]](parent)
-    projectile.from_bytes(source_bytes[2:])
+
+def from_values(net_id, values, pool=None):
+    # __init__ is only for projectiles that are being fired, it would use up
+    # the spread pattern
+    weapon = WEAPON_LOOKUP[values[1]]
+    projectile = weapon.__new__(weapon) if pool is None else pool.take(weapon)
+    projectile.net_id = net_id
+    projectile.from_values(values)
     return projectile
 
 
 index = 0
 spread_pattern = tuple(random.randint(0, 180) for _ in range(360*10))
-def spread_matrix(angle):
+
+
+def seed_spread(seed):
+    # recordings need the same spread on replay
+    global index, spread_pattern
+    rng = random.Random(seed)
+    index = 0
+    spread_pattern = tuple(rng.randint(0, 180) for _ in range(360*10))
+
+
+def spread(angle):
+    """The next angle from the spread pattern in whole degrees, within angle."""
     global index
     index = (index + 1) % 300
-    angle = (spread_pattern[index] % angle * 2) - angle
-    return M2.rot(math.radians(angle))
+    return round((spread_pattern[index] % angle * 2) - angle)
+
+
+def limited(x, y, length):
+    # like Vector.limit without changing anything
+    current = math.sqrt(x * x + y * y)
+    if current > length:
+        return x * length / current, y * length / current
+    return x, y
 
 
 class Weapon:
+    """
+    Like entity.Entity positions and velocities are plain floats, position
+    and velocity give them as Vectors.
+    """
+    __slots__ = (
+        'parent_index', 'x', 'y', 'vx', 'vy', 'colour', 'time_to_live', 'damage', 'size',
+        'impact', 'net_id',
+    )
     WEAPON_ID = 0
-    byte_len = 1 + 1 + 4*4 + 3 + 2 + 1
+    # parent, weapon id, pos x y, vel x y, colour, time to live, size
+    FIELDS = 'BBffffIHB'
+    RECORDS = Records('H', FIELDS)
     cool_down = 100
     recoil = 1
+    DAMAGE = 1
+    IMPACT = 1.0
 
     def __init__(
             self, parent_index, position, velocity,  damage=1, ttl=1000,
             size=3, colour=0xffffff, impact=1.0, spread_angle=0
     ):
         self.parent_index = parent_index
-        self.position = position
-        self.velocity = velocity
+        self.x, self.y = position
+        self.vx, self.vy = velocity
         self.colour = colour
         self.time_to_live = ttl
         self.damage = damage
         self.size = size
         self.impact = impact
+        self.net_id = 0
 
         if spread_angle:
-            self.velocity = spread_matrix(spread_angle) @ self.velocity
+            self.vx, self.vy = angles.rotate(self.vx, self.vy, spread(spread_angle))
+
+    @property
+    def position(self):
+        return Vector((self.x, self.y))
+
+    @position.setter
+    def position(self, vector):
+        self.x, self.y = vector[0], vector[1]
+
+    @property
+    def velocity(self):
+        return Vector((self.vx, self.vy))
+
+    @velocity.setter
+    def velocity(self, vector):
+        self.vx, self.vy = vector[0], vector[1]
 
     def get_dist_squared(self, pos):
-        return (self.position - pos).length_squared
+        dx = self.x - pos[0]
+        dy = self.y - pos[1]
+        return dx * dx + dy * dy
+
+    def reach(self, field, player_size):
+        """
+        Circles (x, y, radius) outside of which hit() does nothing to a
+        player that is at most player_size big, see grid.
+        """
+        return ((self.x, self.y, player_size),)
 
     def tick(self):
-        self.position += self.velocity
+        self.x += self.vx
+        self.y += self.vy
         if self.time_to_live > 0:
             self.time_to_live -= 1
             return False
@@ -60,59 +120,51 @@ class Weapon:
     def hit(self, player):
         if player.name == self.parent_index:
             return False
-        direction = player.position-self.position
-        direction_sq = direction.length_squared
+        dx = player.x - self.x
+        dy = player.y - self.y
+        direction_sq = dx * dx + dy * dy
         player_size_sq = player.size ** 2
         if direction_sq < player_size_sq:  # todo size squared can be cached
-            player.velocity += (self.velocity * self.impact)
+            player.vx += self.vx * self.impact
+            player.vy += self.vy * self.impact
             self.time_to_live = 0
             return self.damage
         else:
             return False
 
-    def from_bytes(self, source_bytes):
-        float_offsets = (0, 4, 8, 12, 16)
-        pos_x, pos_y, vel_x, vel_y = (
-            unpack('f', source_bytes[start:end])[0]
-            for start, end in zip(float_offsets, float_offsets[1:])
-        )
-        self.position = Vector((pos_x, pos_y))
-        self.velocity = Vector((vel_x, vel_y))
-
-        colour1, colour2, colour3, ttl1, ttl2 = (
-            source_bytes[pos] for pos in (16, 17, 18, 19, 20)
+    def from_values(self, values):
+        (
+            self.parent_index, _, self.x, self.y, self.vx, self.vy,
+            self.colour, self.time_to_live, self.size,
+        ) = values
+        # not sent, what the weapon does unless it was fired here
+        self.damage = self.DAMAGE
+        self.impact = self.IMPACT
+
+    def to_values(self):
+        return (
+            self.parent_index, self.WEAPON_ID,
+            self.x, self.y,
+            self.vx, self.vy,
+            self.colour, self.time_to_live, int(self.size),
         )
-        self.colour = (colour1 << 16) + (colour2 << 8) + colour3
-        self.time_to_live = (ttl1 << 8) + ttl2
-
-        self.size = source_bytes[21]
-
-    def to_bytes(self):
-        res = bytearray()
-        res += self.parent_index.to_bytes(1, 'big')
-        res += self.WEAPON_ID.to_bytes(1, 'big')
-        res += pack('f', self.position[0])
-        res += pack('f', self.position[1])
-        res += pack('f', self.velocity[0])
-        res += pack('f', self.velocity[1])
-        res += self.colour.to_bytes(3, 'big')
-        res += self.time_to_live.to_bytes(2, 'big')
-        res += int(self.size).to_bytes(1, 'big')
-        return res
 
 
 class Bullet(Weapon):
+    __slots__ = ()
     WEAPON_ID = 1
     cool_down = 100
     recoil = 15
+    DAMAGE = 10
     shape = 1
 
     def __init__(self, parent):
+        size = parent.size
         super(Bullet, self).__init__(
             parent.name,
-            parent.position + parent.direction*parent.size,
-            parent.direction * 7,
-            damage=10,
+            (parent.x + parent.dx*size, parent.y + parent.dy*size),
+            (parent.dx * 7, parent.dy * 7),
+            damage=Bullet.DAMAGE,
             ttl=360,
             size=5,
             colour=0xe67f19,
@@ -120,17 +172,20 @@ class Bullet(Weapon):
 
 
 class Laser(Weapon):
+    __slots__ = ()
     WEAPON_ID = 2
     cool_down = 20
     recoil = 0
+    DAMAGE = 5
     shape = 1
 
     def __init__(self, parent):
+        size = parent.size
         super(Laser, self).__init__(
             parent.name,
-            parent.position + parent.direction*parent.size,
-            parent.direction * 7,
-            damage=5,
+            (parent.x + parent.dx*size, parent.y + parent.dy*size),
+            (parent.dx * 7, parent.dy * 7),
+            damage=Laser.DAMAGE,
             ttl=60,
             size=5,
             colour=0x66ff11,
@@ -139,17 +194,22 @@ class Laser(Weapon):
 
 
 class Flame(Weapon):
+    __slots__ = ()
     WEAPON_ID = 3
     cool_down = 3
     recoil = 1
+    DAMAGE = 2
     shape = 2
 
     def __init__(self, parent):
+        size = parent.size * 1.2
+        # firing slows the shooter down to 2
+        parent.vx, parent.vy = vx, vy = limited(parent.vx, parent.vy, 2)
         super(Flame, self).__init__(
             parent.name,
-            parent.position + parent.direction*parent.size*1.2,
-            parent.direction * 3 + parent.velocity.limit(2),
-            damage=2,
+            (parent.x + parent.dx*size, parent.y + parent.dy*size),
+            (parent.dx * 3 + vx, parent.dy * 3 + vy),
+            damage=Flame.DAMAGE,
             ttl=150,
             size=5,
             colour=0xfff0f0,
@@ -159,8 +219,10 @@ class Flame(Weapon):
     def tick(self):
         friction = 0.99
         size_increase = 0.3
-        self.position += self.velocity
-        self.velocity *= friction
+        self.x += self.vx
+        self.y += self.vy
+        self.vx *= friction
+        self.vy *= friction
         self.size += size_increase
         r = max((self.colour & 0xff0000) - 0x010000, 0x001000)
         g = max((self.colour & 0x00ff00) - 0x000200, 0x000100)
@@ -172,11 +234,18 @@ class Flame(Weapon):
         else:
             return True
 
+    def reach(self, field, player_size):
+        return ((self.x, self.y, player_size + self.size),)
+
     def hit(self, player):
-        direction = player.position-self.position
-        direction_sq = direction.length_squared
+        dx = player.x - self.x
+        dy = player.y - self.y
+        direction_sq = dx * dx + dy * dy
         if direction_sq < player.size ** 2 + self.size ** 2:
-            player.velocity += direction.unit*self.velocity.length*self.impact
+            if direction_sq:
+                push = math.sqrt((self.vx * self.vx + self.vy * self.vy) / direction_sq) * self.impact
+                player.vx += dx * push
+                player.vy += dy * push
             self.time_to_live = 0
             return self.damage
         else:
@@ -184,20 +253,23 @@ class Flame(Weapon):
 
 
 class Mine(Weapon):
+    __slots__ = ()
     WEAPON_ID = 4
     DURATION = 120 * 10
     SAFE_DURATION = DURATION * 0.8
     DETECTION_RADIUS = 600
     cool_down = 120
     recoil = 1
+    DAMAGE = 25
     shape = 2
 
     def __init__(self, parent):
+        size = parent.size * 1.2
         super(Mine, self).__init__(
             parent.name,
-            parent.position - parent.direction*parent.size*1.2,
-            parent.direction * 1 + parent.velocity,
-            damage=25,
+            (parent.x - parent.dx*size, parent.y - parent.dy*size),
+            (parent.dx + parent.vx, parent.dy + parent.vy),
+            damage=Mine.DAMAGE,
             ttl=Mine.DURATION,
             size=3,
             colour=0xffffff,
@@ -224,88 +296,114 @@ class Mine(Weapon):
         else:
             return True
 
+    def reach(self, field, player_size):
+        if self.time_to_live > int(Mine.SAFE_DURATION):
+            return ()
+        return ((self.x, self.y, max(Mine.DETECTION_RADIUS, player_size + self.size)),)
+
     def hit(self, player):
         if self.time_to_live > int(Mine.SAFE_DURATION):
             return 0
 
-        direction = player.position - self.position
-        if direction.length_squared < Mine.DETECTION_RADIUS ** 2:
+        dx = player.x - self.x
+        dy = player.y - self.y
+        direction_sq = dx * dx + dy * dy
+        if direction_sq < Mine.DETECTION_RADIUS ** 2:
             self.time_to_live = min(int(Mine.DURATION * 0.1), self.time_to_live)
 
         if self.time_to_live == 0:
-            if direction.length_squared < (player.size + self.size) ** 2:
-                player.velocity += direction.unit * 30
+            if direction_sq < (player.size + self.size) ** 2:
+                if direction_sq:
+                    push = 30 / math.sqrt(direction_sq)
+                    player.vx += dx * push
+                    player.vy += dy * push
                 return self.damage
 
         return 0
 
 
 class Minigun(Weapon):
+    __slots__ = ()
     WEAPON_ID = 5
     cool_down = 0
     recoil = 0
+    DAMAGE = 1
+    IMPACT = 0.5
     shape = 1
 
     def __init__(self, parent):
+        size = parent.size
         super(Minigun, self).__init__(
             parent.name,
-            parent.position + parent.direction*parent.size,
-            parent.direction * 6 + parent.velocity,
-            damage=1,
+            (parent.x + parent.dx*size, parent.y + parent.dy*size),
+            (parent.dx * 6 + parent.vx, parent.dy * 6 + parent.vy),
+            damage=Minigun.DAMAGE,
             ttl=50,
             size=1,
             colour=0xe67f19,
-            spread_angle=parent.velocity.length_squared + 6,
-            impact=0.5
+            spread_angle=parent.vx * parent.vx + parent.vy * parent.vy + 6,
+            impact=Minigun.IMPACT
         )
 
 
 class Freeze(Weapon):
+    __slots__ = ()
     WEAPON_ID = 6
     cool_down = 120
     recoil = 0
+    DAMAGE = 0
     shape = 2
 
     def __init__(self, parent):
+        size = parent.size
         super(Freeze, self).__init__(
             parent.name,
-            parent.position + parent.direction*parent.size,
-            parent.direction * 6 + parent.velocity,
-            damage=0,
+            (parent.x + parent.dx*size, parent.y + parent.dy*size),
+            (parent.dx * 6 + parent.vx, parent.dy * 6 + parent.vy),
+            damage=Freeze.DAMAGE,
             ttl=120*3,
             size=10,
             colour=0x5084ac,
         )
 
+    def reach(self, field, player_size):
+        # it jumps onto every player it hits, from there it can hit the next
+        return ((self.x, self.y, float('inf')),)
+
     def hit(self, player):
         if player.name == self.parent_index:
             return 0
 
-        direction = player.position - self.position
-        if direction.length_squared < (self.size + player.size) ** 2:
-            self.velocity = Vector((0, 0))
-            self.position = player.position
+        dx = player.x - self.x
+        dy = player.y - self.y
+        if dx * dx + dy * dy < (self.size + player.size) ** 2:
+            self.vx = self.vy = 0.0
+            self.x, self.y = player.x, player.y
             self.colour = 0xd0d0ff
             self.size = player.size
             self.time_to_live -= 1
-            player.velocity *= 0.94
+            player.vx *= 0.94
+            player.vy *= 0.94
             return False  # todo chance this back to True when dmg is used
         return 0
 
 
 class Meltdown(Weapon):
+    __slots__ = ()
     WEAPON_ID = 7
     cool_down = 1 << 8
     recoil = 0
+    DAMAGE = 10  # plus the score and size of the parent
     shape = 2
     MAX_REACH = 800
 
     def __init__(self, parent):
+        size = parent.size
         super(Meltdown, self).__init__(
             parent.name,
-            parent.position + parent.direction*parent.size,
-            parent.velocity,
-            damage=parent.score + parent.size + 10,
+            (parent.x + parent.dx*size, parent.y + parent.dy*size),
+            (parent.vx, parent.vy),
+            damage=parent.score + size + Meltdown.DAMAGE,
             ttl=1 << 8,
             size=1,
             colour=0x000000,
@@ -324,14 +422,21 @@ class Meltdown(Weapon):
         else:
             return True
 
+    def reach(self, field, player_size):
+        # it is moved onto its parent when that is hit tested
+        radius = player_size + self.size
+        parent = field.players[self.parent_index]
+        return (self.x, self.y, radius), (parent.x, parent.y, radius)
+
     def hit(self, player):
         if player.name == self.parent_index:
-            self.position = player.position
+            self.x, self.y = player.x, player.y
             #player.velocity = self.velocity
 
         if self.time_to_live == 0:
-            direction = self.position - player.position
-            if direction.length_squared < (self.size + player.size) ** 2:
+            dx = self.x - player.x
+            dy = self.y - player.y
+            if dx * dx + dy * dy < (self.size + player.size) ** 2:
                 return self.damage
         return 0
 
@@ -346,3 +451,24 @@ WEAPON_LOOKUP = {
     6: Freeze,
     7: Meltdown,
 }
+
+
+class Pool:
+    """
+    Projectiles that are done with, they are fired again instead of making
+    new ones. Everything is set again by __init__ or from_values.
+    """
+    def __init__(self):
+        self.free = defaultdict(list)  # by weapon
+
+    def take(self, weapon):
+        free = self.free[weapon]
+        return free.pop() if free else weapon.__new__(weapon)
+
+    def fire(self, weapon, parent):
+        projectile = self.take(weapon)
+        projectile.__init__(parent)
+        return projectile
+
+    def release(self, projectile):
+        self.free[type(projectile)].append(projectile)
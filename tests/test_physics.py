@@ -0,0 +1,70 @@
+"""
+The vectorized hit tests should only look at the projectiles near a player,
+see physics.cell_pairs.
+
+    python -m unittest discover tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import physics
+import weapons
+from constants import FIELD_SIZE
+from grid import CELL_SIZE
+
+if physics.AVAILABLE:
+    import numpy as np
+
+
+@unittest.skipUnless(physics.AVAILABLE, 'needs numpy')
+class TestNear(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.positions = np.array(
+            [(rng.uniform(0, FIELD_SIZE), rng.uniform(0, FIELD_SIZE)) for _ in range(200)]
+        )
+        self.group = physics.ProjectileGroup(weapons.Bullet)
+        for net_id in range(1000):
+            # some of them have flown out of the field
+            x = rng.uniform(-200, FIELD_SIZE + 200)
+            y = rng.uniform(-200, FIELD_SIZE + 200)
+            self.group.append(weapons.from_values(net_id, (0, 1, x, y, 7, 0, 0, 360, 5)))
+
+    def dense(self, radius, rows):
+        offset = self.positions[:, None, :] - self.group.position[None, rows, :]
+        players, projectiles = np.nonzero((offset ** 2).sum(axis=2) <= radius ** 2)
+        return set(zip(players.tolist(), rows[projectiles].tolist()))
+
+    def test_only_nearby_pairs(self):
+        for radius, rows in (
+            (30, np.arange(self.group.count)),
+            (600, np.arange(self.group.count)),
+            (50, np.arange(0, self.group.count, 3)),
+        ):
+            with self.subTest(radius=radius):
+                players, projectiles, offset, distance_sq = self.group.near(
+                    self.positions, radius, rows
+                )
+                pairs = set(zip(players.tolist(), projectiles.tolist()))
+                self.assertLessEqual(self.dense(radius, rows), pairs)
+                # nothing from further away than the cells around a player,
+                # those outside of the field are in the cells on its edge
+                cell_size = max(CELL_SIZE, radius)
+                clipped = np.clip(self.group.position[projectiles], 0, FIELD_SIZE)
+                apart = np.abs(self.positions[players] - clipped)
+                self.assertTrue((apart < 2 * cell_size).all())
+                self.assertLess(len(pairs), len(self.positions) * len(rows) / 2)
+
+                order = np.lexsort((projectiles, players))
+                self.assertTrue((order == np.arange(len(order))).all())
+                self.assertTrue(np.allclose(
+                    offset, self.positions[players] - self.group.position[projectiles]
+                ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+The tick of a plain field should not make any Vectors once it is running,
+see entity.Entity. Only Vectors are counted, the grid and the lists and
+sets of Field.step are still made every tick.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import matrixx
+from field import Field
+from replay import seed
+
+
+TICKS = 100
+
+
+class VectorCounter:
+    """Counts the Vectors made while it is used."""
+    def __enter__(self):
+        self.count = 0
+        self.init = matrixx.Vector.__init__
+
+        def init(vector, *args, **kwargs):
+            self.count += 1
+            self.init(vector, *args, **kwargs)
+
+        matrixx.Vector.__init__ = init
+        return self
+
+    def __exit__(self, *exc_info):
+        matrixx.Vector.__init__ = self.init
+
+
+class TestVectorChurn(unittest.TestCase):
+    def run_field(self, weapon_index, shoot):
+        """Vectors made by TICKS ticks after TICKS ticks to warm up."""
+        seed(1)
+        field = Field()
+        for _ in range(20):
+            field.new_player()
+        for player in field.players:
+            player.weapon_index = weapon_index
+
+        def tick(n):
+            for i in range(len(field.players)):
+                field.steer(i, 1, 1, shoot and n % 2, 0)
+            field.step()
+
+        for n in range(TICKS):
+            tick(n)
+        with VectorCounter() as counter:
+            for n in range(TICKS):
+                tick(n)
+        return counter.count
+
+    def test_moving(self):
+        self.assertEqual(self.run_field(0, False), 0)
+
+    def test_shooting(self):
+        for weapon_index in range(7):
+            with self.subTest(weapon_index=weapon_index):
+                self.assertEqual(self.run_field(weapon_index, True), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()